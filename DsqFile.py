@@ -1,6 +1,7 @@
-from .DtsTypes import Sequence, Trigger, Vector, Quaternion
+import numpy as np
+
+from .DtsTypes import Sequence, Trigger
 from struct import pack, unpack, calcsize
-from ctypes import c_byte, c_short, c_int
 
 def read(fd, fmt):
     return unpack(fmt, fd.read(calcsize(fmt)))
@@ -8,26 +9,58 @@ def read(fd, fmt):
 def write(fd, fmt, *values):
     fd.write(pack(fmt, *values))
 
-def write_quat(fd, q):
-    write(fd, "4h",
-        c_short(int(q.x *  32767)).value,
-        c_short(int(q.y *  32767)).value,
-        c_short(int(q.z *  32767)).value,
-        c_short(int(q.w * -32767)).value)
+# Keyframe blocks are read and written as whole arrays. Rotations stay
+# as stored, (N, 4) int16 x, y, z, -w scaled by 32767, vectors are (N, 3)
+# float32 and uniform scales (N,) float32.
+
+quat_dtype = np.dtype("<i2")
+vec_dtype = np.dtype("<f4")
+scale_dtype = np.dtype("<f4")
+
+# Keyframes before version 22 store a rotation and translation per node state
+legacy_state_dtype = np.dtype([("rotation", quat_dtype, 4), ("translation", vec_dtype, 3)])
+
+def read_array(fd, dtype, count, shape=()):
+    shape = (count,) + shape
+    data = bytearray(fd.read(dtype.itemsize * int(np.prod(shape))))
+    return np.frombuffer(data, dtype).reshape(shape)
+
+def skip_array(fd, dtype, count, shape=()):
+    # Like read_array, but seeks past the data and returns no entries
+    fd.seek(dtype.itemsize * count * int(np.prod(shape)), 1)
+    return np.zeros((0,) + shape, dtype)
+
+def read_quats(fd, count, read_array=read_array):
+    return read_array(fd, quat_dtype, count, (4,))
 
-def write_vec(fd, v):
-    write(fd, "3f", v.x, v.y, v.z)
+def read_vecs(fd, count, read_array=read_array):
+    return read_array(fd, vec_dtype, count, (3,))
 
-def read_quat(fd):
-    x, y, z, w = read(fd, "4h")
-    return Quaternion((
-        w / -32767,
-        x /  32767,
-        y /  32767,
-        z /  32767))
+def quat_array(quats):
+    # Accepts stored rotations or anything else holding Quaternions
+    if isinstance(quats, np.ndarray) and quats.dtype.kind == "i":
+        return quats.astype(quat_dtype, copy=False).reshape(-1, 4)
 
-def read_vec(fd):
-    return Vector(read(fd, "3f"))
+    wxyz = np.array([tuple(q) for q in quats], dtype=np.float64).reshape(-1, 4)
+    scaled = wxyz[:, [1, 2, 3, 0]] * (32767, 32767, 32767, -32767)
+    # Round like DtsShape and wrap around like a C short
+    return np.rint(scaled).astype(np.int32).astype(quat_dtype)
+
+def vec_array(vecs):
+    if not isinstance(vecs, np.ndarray):
+        vecs = [tuple(v) for v in vecs]
+
+    return np.asarray(vecs, dtype=vec_dtype).reshape(-1, 3)
+
+def decode_quats(quats):
+    # Stored rotations to an (N, 4) float64 array of w, x, y, z
+    return quat_array(quats)[:, [3, 0, 1, 2]] / (-32767, 32767, 32767, 32767)
+
+def write_quats(fd, quats):
+    fd.write(quat_array(quats).tobytes())
+
+def write_vecs(fd, vecs):
+    fd.write(vec_array(vecs).tobytes())
 
 class DsqFile:
     def __init__(self):
@@ -88,32 +121,24 @@ class DsqFile:
 
         # write all the node states for keyframes
         write(fd, "<i", len(self.rotations))
-        for quat in self.rotations:
-            write_quat(fd, quat)
+        write_quats(fd, self.rotations)
         write(fd, "<i", len(self.translations))
-        for vec in self.translations:
-            write_vec(fd, vec)
+        write_vecs(fd, self.translations)
 
         write(fd, "<i", len(self.uniform_scales))
-        for scale in self.uniform_scales:
-            write(fd, "<f", scale)
+        fd.write(np.asarray(self.uniform_scales, dtype=scale_dtype).tobytes())
         write(fd, "<i", len(self.aligned_scales))
-        for vec in self.aligned_scales:
-            write_vec(fd, vec)
+        write_vecs(fd, self.aligned_scales)
 
         assert len(self.arbitrary_scale_rots) == len(self.arbitrary_scale_factors)
         write(fd, "<i", len(self.arbitrary_scale_rots))
-        for quat in self.arbitrary_scale_rots:
-            write_quat(fd, quat)
-        for vec in self.arbitrary_scale_factors:
-            write_vec(fd, vec)
+        write_quats(fd, self.arbitrary_scale_rots)
+        write_vecs(fd, self.arbitrary_scale_factors)
 
         assert len(self.ground_translations) == len(self.ground_rotations)
         write(fd, "<i", len(self.ground_translations))
-        for vec in self.ground_translations:
-            write_vec(fd, vec)
-        for quat in self.ground_rotations:
-            write_quat(fd, quat)
+        write_vecs(fd, self.ground_translations)
+        write_quats(fd, self.ground_rotations)
 
         # also legacy
         write(fd, "<i", 0)
@@ -135,7 +160,11 @@ class DsqFile:
         (size,) = read(fd, "<i")
         return fd.read(size).decode("cp1252")
 
-    def read(self, fd):
+    def read(self, fd, keyframes=True):
+        # Without keyframes the keyframe tables are skipped and left empty,
+        # for when only the nodes and sequences are of interest
+        table = read_array if keyframes else skip_array
+
         (version,) = read(fd, "<i")
         assert version <= 24, "dsq >v24 not supported yet"
 
@@ -150,23 +179,21 @@ class DsqFile:
             assert false, "TODO: read keyframes from version < 17"
 
         if version > 21:
-            self.rotations = [read_quat(fd) for i in range(read(fd, "<i")[0])]
-            self.translations = [read_vec(fd) for i in range(read(fd, "<i")[0])]
-            self.uniform_scales = [read(fd, "<f") for i in range(read(fd, "<i")[0])]
-            self.aligned_scales = [read_vec(fd) for i in range(read(fd, "<i")[0])]
+            self.rotations = read_quats(fd, read(fd, "<i")[0], table)
+            self.translations = read_vecs(fd, read(fd, "<i")[0], table)
+            self.uniform_scales = table(fd, scale_dtype, read(fd, "<i")[0])
+            self.aligned_scales = read_vecs(fd, read(fd, "<i")[0], table)
             (sz,) = read(fd, "<i")
-            self.arbitrary_scale_rots = [read_quat(fd) for i in range(sz)]
-            self.arbitrary_scale_factors = [read_vec(fd) for i in range(sz)]
+            self.arbitrary_scale_rots = read_quats(fd, sz, table)
+            self.arbitrary_scale_factors = read_vecs(fd, sz, table)
             (sz,) = read(fd, "<i")
-            self.ground_translations = [read_vec(fd) for i in range(sz)]
-            self.ground_rotations = [read_quat(fd) for i in range(sz)]
+            self.ground_translations = read_vecs(fd, sz, table)
+            self.ground_rotations = read_quats(fd, sz, table)
         else:
             (sz,) = read(fd, "<i")
-            self.rotations = [None] * sz
-            self.translations = [None] * sz
-            for i in range(sz):
-                self.rotations[i] = read_quat(fd)
-                self.translations[i] = read_vec(fd)
+            states = table(fd, legacy_state_dtype, sz)
+            self.rotations = np.ascontiguousarray(states["rotation"])
+            self.translations = np.ascontiguousarray(states["translation"])
 
         # also legacy
         read(fd, "<i")
@@ -184,6 +211,6 @@ class DsqFile:
             (num_sjws,) = read(fd, "<i")
             self.triggers = [None] * num_sjws
             for i in range(num_sjws):
-                self.triggers[i] = Trigger(0, 0)
-                self.triggers[i].state = read(fd, "<i")
-                self.triggers[i].pos = read(fd, "<f")
+                (state,) = read(fd, "<i")
+                (pos,) = read(fd, "<f")
+                self.triggers[i] = Trigger(state, pos)
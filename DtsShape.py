@@ -90,11 +90,12 @@ class DtsOutputStream(object):
 		self.write_vec3(box.max)
 
 	def write_quat(self, quat):
+		# Rounded so that quaternions read from a file are written back unchanged
 		self.write16(
-			c_short(int(quat.x *  32767)).value,
-			c_short(int(quat.y *  32767)).value,
-			c_short(int(quat.z *  32767)).value,
-			c_short(int(quat.w * -32767)).value)
+			c_short(round(quat.x *  32767)).value,
+			c_short(round(quat.y *  32767)).value,
+			c_short(round(quat.z *  32767)).value,
+			c_short(round(quat.w * -32767)).value)
 
 class DtsInputStream(object):
 	def __init__(self, fd):
@@ -147,6 +148,24 @@ class DtsInputStream(object):
 		self.tell8 += 1
 		return data
 
+	def skip32(self, count):
+		self.tell32 += count
+
+		if self.tell32 > len(self.buffer32):
+			raise EOFError()
+
+	def skip16(self, count):
+		self.tell16 += count
+
+		if self.tell16 > len(self.buffer16):
+			raise EOFError()
+
+	def skip8(self, count):
+		self.tell8 += count
+
+		if self.tell8 > len(self.buffer8):
+			raise EOFError()
+
 	def read_float(self):
 		return unpack("f", pack("i", self.read32()))[0]
 
@@ -176,6 +195,55 @@ class DtsInputStream(object):
 		w = self.read16() / -32767
 		return Quaternion((w, x, y, z))
 
+def read_materials(fd, dtsVersion):
+	material_type = unpack("b", fd.read(1))[0]
+	assert material_type == 0x1
+
+	n_material = unpack("i", fd.read(4))[0]
+	materials = [Material() for i in range(n_material)]
+
+	for i in range(n_material):
+		if dtsVersion >= 26:
+			length = unpack("i", fd.read(4))[0]
+		else:
+			length = unpack("B", fd.read(1))[0]
+
+		materials[i].name = fd.read(length).decode("cp1252")
+
+	for i in range(n_material):
+		materials[i].flags = unpack("I", fd.read(4))[0]
+	for i in range(n_material):
+		materials[i].reflectanceMap = unpack("i", fd.read(4))[0]
+	for i in range(n_material):
+		materials[i].bumpMap = unpack("i", fd.read(4))[0]
+	for i in range(n_material):
+		materials[i].detailMap = unpack("i", fd.read(4))[0]
+
+	if dtsVersion == 25:
+		for i in range(n_material):
+			fd.read(4)
+
+	for i in range(n_material):
+		materials[i].detailScale = unpack("f", fd.read(4))[0]
+	for i in range(n_material):
+		materials[i].reflectance = unpack("f", fd.read(4))[0]
+
+	return materials
+
+def load_materials(fd):
+	# Reads only the materials of a shape. They come after the sequences at
+	# the end of the file, so this seeks past the tri-buffer section and
+	# skims the sequences instead of decoding everything.
+	dtsVersion, exporterVersion, end8, end32, end16 = unpack("hhiii", fd.read(16))
+	fd.seek(16 + end8 * 4)
+
+	n_sequence = unpack("i", fd.read(4))[0]
+
+	for i in range(n_sequence):
+		Sequence.skip(fd)
+
+	return read_materials(fd, dtsVersion)
+
 class DtsShape(object):
 	def __init__(self):
 		self.nodes = []
@@ -347,9 +415,9 @@ class DtsShape(object):
 		# Ground transformations
 		assert len(self.ground_translations) == len(self.ground_rotations)
 		for point in self.ground_translations:
-			self.write_vec3(point)
+			stream.write_vec3(point)
 		for quat in self.ground_rotations:
-			self.write_quat(quat)
+			stream.write_quat(quat)
 		stream.guard(10)
 
 		# Object states
@@ -418,7 +486,9 @@ class DtsShape(object):
 		for mat in self.materials:
 			ws(fd, "f", mat.reflectance)
 
-	def load(self, fd):
+	def load(self, fd, skip_meshes=False):
+		# With skip_meshes the meshes are stepped over and left out, for
+		# when only the rest of the shape is of interest
 		stream = DtsInputStream(fd)
 
 		# Header
@@ -562,7 +632,12 @@ class DtsShape(object):
 		stream.guard()
 
 		# Meshes
-		self.meshes = [Mesh.read(stream) for i in range(n_mesh)]
+		self.meshes = []
+		for i in range(n_mesh):
+			if skip_meshes:
+				Mesh.skip(stream)
+			else:
+				self.meshes.append(Mesh.read(stream, self.meshes))
 		stream.guard()
 
 		# Names
@@ -571,7 +646,7 @@ class DtsShape(object):
 
 		for i in range(n_name):
 			self.names[i] = stream.read_string()
-			self._names_lookup[self.names[i]] = i
+			self._names_lookup.setdefault(self.names[i].lower(), i)
 
 		stream.guard()
 
@@ -591,34 +666,4 @@ class DtsShape(object):
 		for i in range(n_sequence):
 			self.sequences[i] = Sequence.read(fd)
 
-		material_type = unpack("b", fd.read(1))[0]
-		assert material_type == 0x1
-
-		n_material = unpack("i", fd.read(4))[0]
-		self.materials = [Material() for i in range(n_material)]
-
-		for i in range(n_material):
-			if stream.dtsVersion >= 26:
-				length = unpack("i", fd.read(4))[0]
-			else:
-				length = unpack("B", fd.read(1))[0]
-
-			self.materials[i].name = fd.read(length).decode("cp1252")
-
-		for i in range(n_material):
-			self.materials[i].flags = unpack("I", fd.read(4))[0]
-		for i in range(n_material):
-			self.materials[i].reflectanceMap = unpack("i", fd.read(4))[0]
-		for i in range(n_material):
-			self.materials[i].bumpMap = unpack("i", fd.read(4))[0]
-		for i in range(n_material):
-			self.materials[i].detailMap = unpack("i", fd.read(4))[0]
-
-		if stream.dtsVersion == 25:
-			for i in range(n_material):
-				fd.read(4)
-
-		for i in range(n_material):
-			self.materials[i].detailScale = unpack("f", fd.read(4))[0]
-		for i in range(n_material):
-			self.materials[i].reflectance = unpack("f", fd.read(4))[0]
+		self.materials = read_materials(fd, stream.dtsVersion)
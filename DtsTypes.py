@@ -133,11 +133,9 @@ class DetailLevel:
                 self.subshape = subshape
                 self.objectDetail = objectDetail
                 self.size = size
-
-                # Unused
-                self.avgError = -1.0
-                self.maxError = -1.0
-                self.polyCount = 0
+                self.avgError = avgError
+                self.maxError = maxError
+                self.polyCount = polyCount
 
         def write(self, stream):
                 stream.write32(self.name, self.subshape, self.objectDetail)
@@ -209,6 +207,12 @@ class Mesh:
                 self.bones = []
                 self.influences = []
 
+                # Skin meshes store their undeformed vertices separately,
+                # None writes the ones above in their place
+                self.initial_verts = None
+                self.initial_normals = None
+                self.initial_enormals = None
+
         def get_type(self):
                 return self.type & Mesh.TypeMask
 
@@ -266,20 +270,24 @@ class Mesh:
                 stream.write_vec3(self.center)
                 stream.write_float(self.radius)
 
-                # Geometry data
+                # Geometry data, a mesh with a parent uses the parent's arrays
+                # and only stores their sizes
                 stream.write32(len(self.verts))
-                for vert in self.verts:
-                        stream.write_vec3(vert)
+                if self.parent < 0:
+                        for vert in self.verts:
+                                stream.write_vec3(vert)
                 stream.write32(len(self.tverts))
-                for tvert in self.tverts:
-                        stream.write_vec2(tvert)
+                if self.parent < 0:
+                        for tvert in self.tverts:
+                                stream.write_vec2(tvert)
 
                 assert len(self.normals) == len(self.verts)
                 assert len(self.enormals) == len(self.verts)
-                for normal in self.normals:
-                        stream.write_vec3(normal)
-                for enormal in self.enormals:
-                        stream.write8(enormal)
+                if self.parent < 0:
+                        for normal in self.normals:
+                                stream.write_vec3(normal)
+                        for enormal in self.enormals:
+                                stream.write8(enormal)
 
                 # Primitives and other stuff
                 stream.write32(len(self.primitives))
@@ -296,35 +304,44 @@ class Mesh:
                 stream.guard()
 
                 if mtype == Mesh.SkinType:
-                    stream.write32(len(self.verts))
-                    for v in self.verts:
-                        stream.write_vec3(v)
-                    for v in self.normals:
-                        stream.write_vec3(v)
-                    stream.write8(*self.enormals)
+                    verts = self.verts if self.initial_verts is None else self.initial_verts
+                    normals = self.normals if self.initial_normals is None else self.initial_normals
+                    enormals = self.enormals if self.initial_enormals is None else self.initial_enormals
+
+                    # With a parent all of this is shared, only sizes are stored
+                    stream.write32(len(verts))
+                    if self.parent < 0:
+                        for v in verts:
+                            stream.write_vec3(v)
+                        for v in normals:
+                            stream.write_vec3(v)
+                        stream.write8(*enormals)
 
                     stream.write32(len(self.bones))
-                    for _, initial_transform in self.bones:
-                        for f in initial_transform:
-                            stream.write_float(f)
+                    if self.parent < 0:
+                        for _, initial_transform in self.bones:
+                            for f in initial_transform:
+                                stream.write_float(f)
 
                     stream.write32(len(self.influences))
-                    for vertex_index, _, _ in self.influences:
-                        stream.write32(vertex_index)
-                    for _, bone_index, _ in self.influences:
-                        stream.write32(bone_index)
-                    for _, _, weight in self.influences:
-                        stream.write_float(weight)
+                    if self.parent < 0:
+                        for vertex_index, _, _ in self.influences:
+                            stream.write32(vertex_index)
+                        for _, bone_index, _ in self.influences:
+                            stream.write32(bone_index)
+                        for _, _, weight in self.influences:
+                            stream.write_float(weight)
 
                     stream.write32(len(self.bones))
-                    for node_index, _ in self.bones:
-                        stream.write32(node_index)
+                    if self.parent < 0:
+                        for node_index, _ in self.bones:
+                            stream.write32(node_index)
 
                     stream.guard()
                 elif mtype != Mesh.StandardType:
                         raise ValueError("cannot write {} mesh".format(mtype))
 
-        def read_standard_mesh(self, stream):
+        def read_standard_mesh(self, stream, meshes):
                 stream.guard()
 
                 self.numFrames = stream.read32()
@@ -335,13 +352,26 @@ class Mesh:
                 self.radius = stream.read_float()
 
                 # Geometry data
-                n_vert = stream.read32()
-                self.verts = [stream.read_vec3() for i in range(n_vert)]
-                n_tvert = stream.read32()
-                self.tverts = [stream.read_vec2() for i in range(n_tvert)]
-                self.normals = [stream.read_vec3() for i in range(n_vert)]
-                # TODO: don't read this when not relevant
-                self.enormals = [stream.read8() for i in range(n_vert)]
+                if self.parent >= 0:
+                        if self.parent >= len(meshes):
+                                raise ValueError("mesh parent {} is not an earlier mesh".format(self.parent))
+
+                        # Shared with the parent, only the sizes are stored
+                        parent = meshes[self.parent]
+                        stream.read32()
+                        self.verts = parent.verts
+                        stream.read32()
+                        self.tverts = parent.tverts
+                        self.normals = parent.normals
+                        self.enormals = parent.enormals
+                else:
+                        n_vert = stream.read32()
+                        self.verts = [stream.read_vec3() for i in range(n_vert)]
+                        n_tvert = stream.read32()
+                        self.tverts = [stream.read_vec2() for i in range(n_tvert)]
+                        self.normals = [stream.read_vec3() for i in range(n_vert)]
+                        # TODO: don't read this when not relevant
+                        self.enormals = [stream.read8() for i in range(n_vert)]
 
                 # Primitives and other stuff
                 self.primitives = [Primitive.read(stream) for i in range(stream.read32())]
@@ -352,13 +382,25 @@ class Mesh:
 
                 stream.guard()
 
-        def read_skin_mesh(self, stream):
-                self.read_standard_mesh(stream)
+        def read_skin_mesh(self, stream, meshes):
+                self.read_standard_mesh(stream, meshes)
+
+                if self.parent >= 0:
+                        # Shared with the parent, only the sizes are stored
+                        parent = meshes[self.parent]
+                        self.initial_verts = parent.initial_verts
+                        self.initial_normals = parent.initial_normals
+                        self.initial_enormals = parent.initial_enormals
+                        self.bones = parent.bones
+                        self.influences = parent.influences
+                        stream.skip32(4)
+                        stream.guard()
+                        return
 
                 sz = stream.read32()
-                _ = [stream.read_vec3() for i in range(sz)]
-                _ = [stream.read_vec3() for i in range(sz)]
-                _ = [stream.read8() for i in range(sz)]
+                self.initial_verts = [stream.read_vec3() for i in range(sz)]
+                self.initial_normals = [stream.read_vec3() for i in range(sz)]
+                self.initial_enormals = [stream.read8() for i in range(sz)]
 
                 sz = stream.read32()
                 self.bones = [[None, None] for i in range(sz)]
@@ -386,14 +428,66 @@ class Mesh:
                 stream.guard()
 
         @classmethod
-        def read(cls, stream):
+        def skip(cls, stream):
+                # Moves past a mesh without decoding it, returns the mesh type
+                mtype = stream.read32() & Mesh.TypeMask
+
+                if mtype == Mesh.NullType:
+                        return mtype
+                elif mtype != Mesh.StandardType and mtype != Mesh.SkinType:
+                        raise ValueError("don't know how to read {} mesh".format(mtype))
+
+                stream.guard()
+
+                stream.skip32(2) # numFrames, numMatFrames
+                parent = stream.read32()
+                stream.skip32(10) # bounds, center, radius
+
+                n_vert = stream.read32()
+
+                if parent >= 0:
+                        stream.read32()
+                else:
+                        stream.skip32(3 * n_vert)
+                        n_tvert = stream.read32()
+                        stream.skip32(2 * n_tvert + 3 * n_vert)
+                        stream.skip8(n_vert)
+
+                n_primitive = stream.read32()
+                stream.skip16(2 * n_primitive)
+                stream.skip32(n_primitive)
+                stream.skip16(stream.read32()) # indices
+                stream.skip16(stream.read32()) # mindices
+                stream.skip32(2) # vertsPerFrame, flags
+
+                stream.guard()
+
+                if mtype == Mesh.SkinType:
+                        # A skin mesh with a parent shares all of this with
+                        # it and only stores the sizes
+                        inline = 1 if parent < 0 else 0
+
+                        sz = stream.read32()
+                        stream.skip32(6 * sz * inline)
+                        stream.skip8(sz * inline)
+                        stream.skip32(16 * stream.read32() * inline) # initial transforms
+                        stream.skip32(3 * stream.read32() * inline) # influences
+                        stream.skip32(stream.read32() * inline) # bone nodes
+
+                        stream.guard()
+
+                return mtype
+
+        @classmethod
+        def read(cls, stream, meshes=()):
+                # meshes are the ones read so far, for resolving parents
                 mtype = stream.read32() & Mesh.TypeMask
                 mesh = cls(mtype)
 
                 if mtype == Mesh.StandardType:
-                        mesh.read_standard_mesh(stream)
+                        mesh.read_standard_mesh(stream, meshes)
                 elif mtype == Mesh.SkinType:
-                        mesh.read_skin_mesh(stream)
+                        mesh.read_skin_mesh(stream, meshes)
                 # others here
                 elif mtype == Mesh.NullType:
                         pass
@@ -520,6 +614,15 @@ class Sequence:
                 numWords = unpack("i", fd.read(4))[0]
                 return unpack(str(numWords) + "i", fd.read(4 * numWords))
 
+        @classmethod
+        def skip(cls, fd):
+                # Moves past a sequence with a name index without decoding it
+                fd.seek(15 * 4, 1)
+
+                for i in range(8):
+                        dummy, numWords = unpack("<ii", fd.read(8))
+                        fd.seek(4 * numWords, 1)
+
         @classmethod
         def read(cls, fd, readIndex=True):
                 seq = cls()
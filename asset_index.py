@@ -0,0 +1,280 @@
+import os
+import sys
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from .DtsShape import DtsShape
+from .DsqFile import DsqFile
+
+# Keeps an SQLite index of the nodes, objects, detail levels, sequences and
+# materials of every .dts and .dsq in a directory tree. Files are only read
+# again when their modification time or size changed.
+
+schema = """
+PRAGMA foreign_keys = ON;
+
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    error TEXT
+);
+
+CREATE TABLE IF NOT EXISTS names (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    name TEXT NOT NULL COLLATE NOCASE
+);
+
+CREATE TABLE IF NOT EXISTS nodes (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    name TEXT NOT NULL COLLATE NOCASE,
+    parent INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS objects (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    name TEXT NOT NULL COLLATE NOCASE,
+    node INTEGER NOT NULL,
+    num_meshes INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS detail_levels (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    name TEXT NOT NULL COLLATE NOCASE,
+    size REAL NOT NULL,
+    poly_count INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sequences (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    name TEXT NOT NULL COLLATE NOCASE,
+    flags INTEGER NOT NULL,
+    num_keyframes INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    priority INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS materials (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    name TEXT NOT NULL COLLATE NOCASE,
+    flags INTEGER NOT NULL
+);
+
+-- Lookups by name, and by file for replacing and deleting a file's rows
+CREATE INDEX IF NOT EXISTS names_name ON names(name);
+CREATE INDEX IF NOT EXISTS nodes_name ON nodes(name);
+CREATE INDEX IF NOT EXISTS objects_name ON objects(name);
+CREATE INDEX IF NOT EXISTS detail_levels_name ON detail_levels(name);
+CREATE INDEX IF NOT EXISTS sequences_name ON sequences(name);
+CREATE INDEX IF NOT EXISTS materials_name ON materials(name);
+CREATE INDEX IF NOT EXISTS names_file ON names(file_id);
+CREATE INDEX IF NOT EXISTS nodes_file ON nodes(file_id);
+CREATE INDEX IF NOT EXISTS objects_file ON objects(file_id);
+CREATE INDEX IF NOT EXISTS detail_levels_file ON detail_levels(file_id);
+CREATE INDEX IF NOT EXISTS sequences_file ON sequences(file_id);
+CREATE INDEX IF NOT EXISTS materials_file ON materials(file_id);
+"""
+
+# Tables filled from the rows read_file returns, with their columns
+row_tables = (
+    ("names", ("idx", "name")),
+    ("nodes", ("idx", "name", "parent")),
+    ("objects", ("idx", "name", "node", "num_meshes")),
+    ("detail_levels", ("idx", "name", "size", "poly_count")),
+    ("sequences", ("idx", "name", "flags", "num_keyframes", "duration", "priority")),
+    ("materials", ("idx", "name", "flags")),
+)
+
+extensions = {".dts": "dts", ".dsq": "dsq"}
+
+# Files stored per transaction, an interrupted refresh keeps what it read
+batch_size = 250
+
+def open_index(path):
+    db = sqlite3.connect(path)
+    db.executescript(schema)
+    return db
+
+def read_shape(fd):
+    shape = DtsShape()
+    shape.load(fd, skip_meshes=True)
+    names = shape.names
+
+    return {
+        "names": list(enumerate(names)),
+        "nodes": [(i, names[node.name], node.parent) for i, node in enumerate(shape.nodes)],
+        "objects": [(i, names[obj.name], obj.node, obj.numMeshes) for i, obj in enumerate(shape.objects)],
+        "detail_levels": [(i, names[lod.name], lod.size, lod.polyCount)
+                          for i, lod in enumerate(shape.detail_levels)],
+        "sequences": [(i, names[seq.nameIndex], seq.flags, seq.numKeyframes, seq.duration, seq.priority)
+                      for i, seq in enumerate(shape.sequences)],
+        "materials": [(i, mat.name, mat.flags) for i, mat in enumerate(shape.materials)],
+    }
+
+def read_dsq(fd):
+    dsq = DsqFile()
+    dsq.read(fd, keyframes=False)
+
+    return {
+        "nodes": [(i, name, None) for i, name in enumerate(dsq.nodes)],
+        "sequences": [(i, seq.name, seq.flags, seq.numKeyframes, seq.duration, seq.priority)
+                      for i, seq in enumerate(dsq.sequences)],
+    }
+
+def read_file(job):
+    # Runs in a worker process
+    path, kind = job
+
+    try:
+        with open(path, "rb") as fd:
+            rows = read_shape(fd) if kind == "dts" else read_dsq(fd)
+    except Exception as e:
+        return path, None, "{}: {}".format(type(e).__name__, e)
+
+    return path, rows, None
+
+def find_files(root):
+    # {path: (kind, mtime_ns, size)} for every shape and sequence file
+    found = {}
+
+    for dirpath, dirnames, filenames in os.walk(os.path.abspath(root)):
+        for filename in filenames:
+            kind = extensions.get(os.path.splitext(filename)[1].lower())
+
+            if kind is not None:
+                path = os.path.join(dirpath, filename)
+
+                # Dangling links and files removed while walking are left out
+                try:
+                    stat = os.stat(path)
+                except OSError as e:
+                    print("Warning: Could not stat {}: {}".format(path, e), file=sys.stderr)
+                    continue
+
+                found[path] = (kind, stat.st_mtime_ns, stat.st_size)
+
+    return found
+
+def store(db, path, kind, mtime_ns, size, rows, error):
+    db.execute("DELETE FROM files WHERE path = ?", (path,))
+    file_id = db.execute(
+        "INSERT INTO files (path, kind, mtime_ns, size, error) VALUES (?, ?, ?, ?, ?)",
+        (path, kind, mtime_ns, size, error)).lastrowid
+
+    if rows is None:
+        return
+
+    for table, columns in row_tables:
+        if table in rows:
+            db.executemany("INSERT INTO {} (file_id, {}) VALUES (?, {})".format(
+                table, ", ".join(columns), ", ".join("?" * len(columns))),
+                [(file_id,) + tuple(row) for row in rows[table]])
+
+def refresh(db, root, workers):
+    # Brings the index of everything under root up to date.
+    # Returns the number of files read and removed.
+    root = os.path.join(os.path.abspath(root), "")
+    found = find_files(root)
+
+    known = {}
+
+    for path, mtime_ns, size in db.execute("SELECT path, mtime_ns, size FROM files"):
+        if path.startswith(root):
+            known[path] = (mtime_ns, size)
+
+    removed = [path for path in known if path not in found]
+    changed = sorted(path for path, (kind, mtime_ns, size) in found.items()
+                     if known.get(path) != (mtime_ns, size))
+
+    with db:
+        db.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+
+    if changed:
+        jobs = [(path, found[path][0]) for path in changed]
+        chunksize = max(1, len(jobs) // (workers * 8))
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(read_file, jobs, chunksize=chunksize)
+
+            for count, (path, rows, error) in enumerate(results, 1):
+                kind, mtime_ns, size = found[path]
+
+                if error is not None:
+                    print("Warning: Could not read {}: {}".format(path, error), file=sys.stderr)
+
+                store(db, path, kind, mtime_ns, size, rows, error)
+
+                if count % batch_size == 0:
+                    db.commit()
+
+        db.commit()
+
+    return len(changed), len(removed)
+
+queries = {
+    "node": ("Files with a node of this name",
+        "SELECT DISTINCT files.path FROM nodes JOIN files ON files.id = nodes.file_id "
+        "WHERE nodes.name = ? ORDER BY files.path"),
+    "sequence": ("Files with a sequence of this name",
+        "SELECT files.path, sequences.num_keyframes, sequences.duration FROM sequences "
+        "JOIN files ON files.id = sequences.file_id WHERE sequences.name = ? ORDER BY files.path"),
+    "material": ("Shapes using a material of this name",
+        "SELECT DISTINCT files.path FROM materials JOIN files ON files.id = materials.file_id "
+        "WHERE materials.name = ? ORDER BY files.path"),
+    "polycount": ("Total polygon count and number of shapes per detail level name",
+        "SELECT name, SUM(poly_count), COUNT(*) FROM detail_levels GROUP BY name ORDER BY name"),
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index DTS and DSQ files in an SQLite database")
+    parser.add_argument("database", help="SQLite file holding the index, created if needed")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    refresh_parser = commands.add_parser("refresh", help="Add new and changed files, drop removed ones")
+    refresh_parser.add_argument("root", help="Directory to index")
+    refresh_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                                help="Number of processes reading files at once")
+
+    for name, (description, sql) in queries.items():
+        query_parser = commands.add_parser(name, help=description)
+
+        if "?" in sql:
+            query_parser.add_argument("name")
+
+    sql_parser = commands.add_parser("sql", help="Run any SQL query against the index")
+    sql_parser.add_argument("query")
+
+    args = parser.parse_args(argv)
+    db = open_index(args.database)
+
+    try:
+        if args.command == "refresh":
+            read, removed = refresh(db, args.root, args.workers)
+            print("Read {} files, removed {}".format(read, removed), file=sys.stderr)
+            return 0
+
+        if args.command == "sql":
+            cursor = db.execute(args.query)
+        else:
+            description, sql = queries[args.command]
+            cursor = db.execute(sql, (args.name,) if "?" in sql else ())
+
+        for row in cursor:
+            print("\t".join("" if value is None else str(value) for value in row))
+    finally:
+        db.close()
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import time
+import argparse
+from contextlib import contextmanager
+
+from .worker_pool import WorkerPool
+
+# The manifest is a JSON list of jobs (or {"jobs": [...]}), for example:
+#
+# [
+#   {"blend": "weapons/gun.blend", "output": "out/gun.dts",
+#    "collection": "Gun", "options": {"blank_material": false}},
+#   {"blend": "anims/player.blend", "scene": "Run", "output": "out/run.dsq"}
+# ]
+#
+# Relative paths are resolved against the manifest's directory. The format
+# follows the output extension unless "format" is given. "options" are
+# passed to export_dts.save / export_dsq.save as keyword arguments.
+
+def load_manifest(path):
+    with open(path) as fd:
+        manifest = json.load(fd)
+
+    if isinstance(manifest, dict):
+        manifest = manifest["jobs"]
+
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+
+    for index, entry in enumerate(manifest):
+        job = dict(entry)
+        job["index"] = index
+        job["handler"] = "batch_export:run_job"
+        job["blend"] = os.path.join(base, entry["blend"])
+        job["output"] = os.path.join(base, entry["output"])
+
+        if "format" not in job:
+            job["format"] = os.path.splitext(job["output"])[1].lstrip(".").lower()
+
+        if job["format"] not in ("dts", "dsq"):
+            raise ValueError("Job {}: unknown export format '{}'".format(index, job["format"]))
+
+        jobs.append(job)
+
+    return jobs
+
+class JobOperator:
+    # Stands in for the export operator so fail() has somewhere to report to
+
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+
+    def report(self, type, message):
+        if "ERROR" in type:
+            self.errors.append(message)
+        else:
+            self.warnings.append(message)
+
+@contextmanager
+def scene_context(bpy, scene):
+    if scene == bpy.context.scene:
+        yield bpy.context
+    elif hasattr(bpy.context, "temp_override"):
+        with bpy.context.temp_override(scene=scene, view_layer=scene.view_layers[0]):
+            yield bpy.context
+    else:
+        raise RuntimeError("Exporting a scene other than the active one needs Blender 3.2 or newer")
+
+def run_job(job):
+    # Runs inside a Blender worker
+    import bpy
+    from . import export_dts, export_dsq
+
+    bpy.ops.wm.open_mainfile(filepath=job["blend"])
+
+    if job.get("scene"):
+        scene = bpy.data.scenes[job["scene"]]
+    else:
+        scene = bpy.context.scene
+
+    options = dict(job.get("options", {}))
+    operator = JobOperator()
+
+    os.makedirs(os.path.dirname(job["output"]) or ".", exist_ok=True)
+
+    start = time.perf_counter()
+
+    with scene_context(bpy, scene) as context:
+        if job.get("collection"):
+            if job["format"] != "dts":
+                raise ValueError("Only DTS export can be limited to a collection")
+
+            members = set(bpy.data.collections[job["collection"]].all_objects)
+
+            for ob in scene.objects:
+                ob.select_set(ob in members)
+
+            options["select_object"] = True
+
+        if job["format"] == "dts":
+            export_dts.save(operator, context, job["output"], **options)
+        else:
+            export_dsq.save(operator, context, job["output"], **options)
+
+    return {
+        "ok": not operator.errors,
+        "errors": operator.errors,
+        "warnings": operator.warnings,
+        "export_seconds": time.perf_counter() - start,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export DTS/DSQ files from many .blend files with a pool of background Blender processes")
+    parser.add_argument("manifest", help="JSON file listing the export jobs")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"),
+                        help="Blender executable (default: $BLENDER or 'blender')")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Number of Blender processes to run at once")
+    parser.add_argument("--timeout", type=float, default=600,
+                        help="Seconds a job may take before its worker is killed and the job fails, 0 for no limit")
+    parser.add_argument("--results", help="Write the per-job results to this JSON file instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="Print the Blender output of failed jobs")
+    args = parser.parse_args(argv)
+
+    jobs = load_manifest(args.manifest)
+    pool = WorkerPool(args.blender, min(args.workers, len(jobs)), args.timeout or None)
+    results = [None] * len(jobs)
+    start = time.perf_counter()
+
+    for job, reply in pool.run(jobs):
+        result = {
+            "blend": job["blend"],
+            "scene": job.get("scene"),
+            "collection": job.get("collection"),
+            "output": job["output"],
+            "ok": reply.get("ok", False),
+            "seconds": round(reply["seconds"], 3),
+        }
+
+        if "export_seconds" in reply:
+            result["export_seconds"] = round(reply["export_seconds"], 3)
+
+        for key in ("error", "errors", "warnings"):
+            if reply.get(key):
+                result[key] = reply[key]
+
+        results[job["index"]] = result
+
+        status = "ok" if result["ok"] else "FAILED"
+        print("[{}] {} -> {} ({:.2f}s)".format(status, job["blend"], job["output"], reply["seconds"]),
+              file=sys.stderr)
+
+        if not result["ok"] and args.verbose:
+            print("\n".join(reply.get("log", [])), file=sys.stderr)
+
+    failed = sum(1 for result in results if not result["ok"])
+
+    summary = {
+        "jobs": results,
+        "failed": failed,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+    if args.results:
+        with open(args.results, "w") as fd:
+            json.dump(summary, fd, indent=2)
+    else:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
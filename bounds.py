@@ -0,0 +1,91 @@
+import numpy as np
+
+from .DtsTypes import Box, Vector
+
+def point_array(points, matrix=None):
+    # (N, 3) float64 array of points, optionally transformed by a 4x4 matrix
+    array = np.array([tuple(point) for point in points], dtype=np.float64).reshape(-1, 3)
+
+    if matrix is not None and len(array):
+        m = np.array(matrix, dtype=np.float64)
+        array = array @ m[:3, :3].T + m[:3, 3]
+
+    return array
+
+def box_bounds(points):
+    if not len(points):
+        return Box(Vector(), Vector())
+
+    return Box(Vector(points.min(axis=0)), Vector(points.max(axis=0)))
+
+def box_corners(box):
+    # (8, 3) array of the corners of a box
+    lo, hi = tuple(box.min), tuple(box.max)
+    return np.array([(x, y, z) for x in (lo[0], hi[0]) for y in (lo[1], hi[1]) for z in (lo[2], hi[2])],
+                    dtype=np.float64)
+
+def farthest(points, center):
+    distances = np.einsum("ij,ij->i", points - center, points - center)
+    index = int(distances.argmax())
+    return index, distances[index] ** 0.5
+
+def ritter_sphere(points):
+    # Start from two far apart points and grow the sphere over every
+    # point left outside
+    a = points[farthest(points, points[0])[0]]
+    b = points[farthest(points, a)[0]]
+    center = (a + b) / 2
+    radius = np.linalg.norm(b - a) / 2
+
+    while True:
+        index, distance = farthest(points, center)
+
+        if distance <= radius * (1 + 1e-9):
+            return center, radius
+
+        # Move toward the outside point just enough to include it
+        radius = (radius + distance) / 2
+        center = center + (points[index] - center) * ((distance - radius) / distance)
+
+def refine_sphere(points, center, radius, iterations=200):
+    # Badoiu-Clarkson: stepping toward the farthest point with a shrinking
+    # step converges on the minimal sphere. Keep the best one seen.
+    best_center, best_radius = center, radius
+    current = center
+
+    for i in range(1, iterations + 1):
+        index, distance = farthest(points, current)
+
+        if distance < best_radius:
+            best_center, best_radius = current, distance
+
+        current = current + (points[index] - current) / (i + 1)
+
+    return best_center, best_radius
+
+def bounding_sphere(points):
+    # Near-minimal sphere around the points, returns (center, radius)
+    if not len(points):
+        return Vector(), 0.0
+
+    center, radius = ritter_sphere(points)
+    center, radius = refine_sphere(points, center, radius)
+
+    # The center is stored in single precision, measure against that one
+    # and leave a little room for the radius being rounded as well
+    center = Vector(center)
+    radius = farthest(points, np.array(center))[1] * (1 + 1e-6)
+    return center, float(radius)
+
+def tube_radius(points, center):
+    # Radius of the vertical cylinder through center around the points
+    if not len(points):
+        return 0.0
+
+    delta = points[:, :2] - np.array(center[:2])
+    return float(np.sqrt(np.einsum("ij,ij->i", delta, delta).max()))
+
+def set_mesh_bounds(dmesh):
+    points = point_array(dmesh.verts)
+    dmesh.bounds = box_bounds(points)
+    dmesh.center, dmesh.radius = bounding_sphere(points)
@@ -0,0 +1,124 @@
+import bmesh
+from mathutils import Vector
+
+def bmesh_from_points(points):
+    bm = bmesh.new()
+
+    for point in points:
+        bm.verts.new(point)
+
+    return bm
+
+def bounds(bm):
+    low = Vector([min(v.co[i] for v in bm.verts) for i in range(3)])
+    high = Vector([max(v.co[i] for v in bm.verts) for i in range(3)])
+    return low, high
+
+def longest_axis(bm):
+    low, high = bounds(bm)
+    size = high - low
+    axis = max(range(3), key=lambda i: size[i])
+    return axis, size[axis], (low + high) / 2
+
+def split_bmesh(bm, axis, center):
+    # Cut the geometry in two along a plane, both halves keep the cut
+    # so their hulls meet without a gap
+    normal = Vector((0, 0, 0))
+    normal[axis] = 1
+
+    halves = []
+
+    for clear_outer in (True, False):
+        half = bm.copy()
+        bmesh.ops.bisect_plane(half,
+            geom=half.verts[:] + half.edges[:] + half.faces[:],
+            plane_co=center, plane_no=normal,
+            clear_outer=clear_outer, clear_inner=not clear_outer)
+        halves.append(half)
+
+    return halves
+
+def farthest_points(points, count):
+    # Spread count points over the set by repeatedly taking the one
+    # farthest from everything picked so far
+    picked = [max(points, key=lambda p: p.length_squared)]
+    distances = [(p - picked[0]).length_squared for p in points]
+
+    while len(picked) < count:
+        index = max(range(len(points)), key=distances.__getitem__)
+        picked.append(points[index])
+
+        for i, point in enumerate(points):
+            distances[i] = min(distances[i], (point - points[index]).length_squared)
+
+    return picked
+
+def hull_bmesh(points, max_verts):
+    bm = bmesh_from_points(points)
+    result = bmesh.ops.convex_hull(bm, input=bm.verts[:])
+
+    # Drop everything that did not end up on the hull
+    unused = [ele for ele in result["geom_interior"] + result["geom_unused"]
+              if isinstance(ele, bmesh.types.BMVert)]
+    bmesh.ops.delete(bm, geom=unused, context='VERTS')
+
+    if not bm.faces:
+        bm.free()
+        return None
+
+    if max_verts and len(bm.verts) > max_verts:
+        hull_points = [v.co.copy() for v in bm.verts]
+        bm.free()
+        return hull_bmesh(farthest_points(hull_points, max_verts), 0)
+
+    bmesh.ops.triangulate(bm, faces=bm.faces[:])
+    return bm
+
+def convex_decomposition(points, faces, max_hulls, max_verts, min_size=0.001):
+    # Approximate a mesh with at most max_hulls convex hulls by repeatedly
+    # cutting the largest piece in half along its longest axis.
+    # Returns a list of BMesh hulls, the caller frees them.
+    bm = bmesh.new()
+    verts = [bm.verts.new(point) for point in points]
+
+    for face in faces:
+        try:
+            bm.faces.new([verts[i] for i in face])
+        except ValueError:
+            pass # Duplicate face
+
+    pieces = [bm]
+
+    while len(pieces) < max_hulls:
+        candidates = [(longest_axis(piece), piece) for piece in pieces if len(piece.verts) >= 4]
+
+        if not candidates:
+            break
+
+        (axis, size, center), piece = max(candidates, key=lambda c: c[0][1])
+
+        if size < min_size:
+            break
+
+        pieces.remove(piece)
+
+        for half in split_bmesh(piece, axis, center):
+            if half.verts:
+                pieces.append(half)
+            else:
+                half.free()
+
+        piece.free()
+
+    hulls = []
+
+    for piece in pieces:
+        if len(piece.verts) >= 4:
+            hull = hull_bmesh([v.co.copy() for v in piece.verts], max_verts)
+
+            if hull is not None:
+                hulls.append(hull)
+
+        piece.free()
+
+    return hulls
@@ -0,0 +1,234 @@
+import os
+import sys
+import copy
+import argparse
+
+import numpy as np
+
+from .DsqFile import DsqFile, quat_dtype, vec_dtype, scale_dtype
+from .DtsTypes import Sequence, Trigger
+from .sequence_util import animated_nodes, remap_matters, copy_blocks
+
+# Splits DSQ files into one file per sequence and merges DSQ files into a
+# single pack. Keyframes are copied as they are stored, nothing is decoded
+# and quantized again.
+
+class DsqToolError(Exception):
+    pass
+
+# Keyframe tables of a DSQ and the shape of one entry
+tables = (
+    ("rotations", quat_dtype, (4,)),
+    ("translations", vec_dtype, (3,)),
+    ("uniform_scales", scale_dtype, ()),
+    ("aligned_scales", vec_dtype, (3,)),
+    ("arbitrary_scale_rots", quat_dtype, (4,)),
+    ("arbitrary_scale_factors", vec_dtype, (3,)),
+    ("ground_translations", vec_dtype, (3,)),
+    ("ground_rotations", quat_dtype, (4,)),
+)
+
+class DsqBuilder:
+    # Collects sequences from other DSQ files into a new one.
+    # Keyframe blocks are gathered in lists and joined once at the end.
+
+    def __init__(self):
+        self.nodes = []
+        self.node_lookup = {}
+        self.sequence_names = set()
+        self.sequences = []
+        self.triggers = []
+        self.blocks = {name: [] for name, dtype, shape in tables}
+        self.sizes = {name: 0 for name, dtype, shape in tables}
+
+    def node_index(self, name):
+        # Node names are case-insensitive, the first spelling is kept
+        index = self.node_lookup.get(name.lower())
+
+        if index is None:
+            index = len(self.nodes)
+            self.nodes.append(name)
+            self.node_lookup[name.lower()] = index
+
+        return index
+
+    def append(self, table, keys):
+        base = self.sizes[table]
+        self.blocks[table].append(keys)
+        self.sizes[table] += len(keys)
+        return base
+
+    def add_sequence(self, dsq, dseq, mapping):
+        # mapping gives the index in this builder of every node of dsq
+        if dseq.name.lower() in self.sequence_names:
+            raise DsqToolError("More than one sequence is named '{}'".format(dseq.name))
+
+        self.sequence_names.add(dseq.name.lower())
+
+        seq = copy.copy(dseq)
+        count = dseq.numKeyframes
+        num_nodes = len(self.nodes)
+
+        seq.rotationMatters, order = remap_matters(dseq.rotationMatters, mapping, num_nodes)
+        seq.baseRotation = self.append("rotations",
+            copy_blocks(dsq.rotations, dseq.baseRotation, order, count))
+
+        seq.translationMatters, order = remap_matters(dseq.translationMatters, mapping, num_nodes)
+        seq.baseTranslation = self.append("translations",
+            copy_blocks(dsq.translations, dseq.baseTranslation, order, count))
+
+        seq.scaleMatters, order = remap_matters(dseq.scaleMatters, mapping, num_nodes)
+
+        if seq.flags & Sequence.UniformScale:
+            seq.baseScale = self.append("uniform_scales",
+                copy_blocks(dsq.uniform_scales, dseq.baseScale, order, count))
+        elif seq.flags & Sequence.AlignedScale:
+            seq.baseScale = self.append("aligned_scales",
+                copy_blocks(dsq.aligned_scales, dseq.baseScale, order, count))
+        elif seq.flags & Sequence.ArbitraryScale:
+            seq.baseScale = self.append("arbitrary_scale_rots",
+                copy_blocks(dsq.arbitrary_scale_rots, dseq.baseScale, order, count))
+            self.append("arbitrary_scale_factors",
+                copy_blocks(dsq.arbitrary_scale_factors, dseq.baseScale, order, count))
+
+        first, num = dseq.firstGroundFrame, dseq.numGroundFrames
+        seq.firstGroundFrame = self.append("ground_translations", dsq.ground_translations[first:first + num])
+        self.append("ground_rotations", dsq.ground_rotations[first:first + num])
+
+        first, num = dseq.firstTrigger, dseq.numTriggers
+        seq.firstTrigger = len(self.triggers)
+        self.triggers.extend(Trigger(trigger.state, trigger.pos) for trigger in dsq.triggers[first:first + num])
+
+        # DSQ files carry no decal, IFL or object animation
+        seq.decalMatters = [False] * num_nodes
+        seq.iflMatters = list(dseq.iflMatters)
+        seq.visMatters = list(dseq.visMatters)
+        seq.frameMatters = list(dseq.frameMatters)
+        seq.matFrameMatters = list(dseq.matFrameMatters)
+
+        self.sequences.append(seq)
+
+    def build(self):
+        dsq = DsqFile()
+        dsq.nodes = self.nodes
+        dsq.sequences = self.sequences
+        dsq.triggers = self.triggers
+
+        for name, dtype, shape in tables:
+            blocks = self.blocks[name]
+
+            if blocks:
+                setattr(dsq, name, np.concatenate(blocks).astype(dtype, copy=False))
+            else:
+                setattr(dsq, name, np.zeros((0,) + shape, dtype=dtype))
+
+        # The node table may have grown after a sequence was added
+        for seq in self.sequences:
+            for matters in (seq.rotationMatters, seq.translationMatters, seq.scaleMatters, seq.decalMatters):
+                matters.extend([False] * (len(self.nodes) - len(matters)))
+
+        return dsq
+
+def read_dsq(path):
+    dsq = DsqFile()
+
+    with open(path, "rb") as fd:
+        dsq.read(fd)
+
+    # Nodes are matched ignoring case, two of them would end up as one
+    seen = set()
+
+    for name in dsq.nodes:
+        if name.lower() in seen:
+            raise DsqToolError("{} has more than one node named '{}'".format(path, name))
+
+        seen.add(name.lower())
+
+    return dsq
+
+def write_dsq(path, dsq):
+    with open(path, "wb") as fd:
+        dsq.write(fd)
+
+def sequence_filename(name):
+    # Sequence names may hold characters that can't be in a file name
+    return "".join(c if c.isalnum() or c in " -_." else "_" for c in name) + ".dsq"
+
+def split(path, output_dir):
+    # Writes every sequence of a DSQ to its own file, keeping only the
+    # nodes the sequence animates
+    dsq = read_dsq(path)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    written = set()
+
+    for dseq in dsq.sequences:
+        builder = DsqBuilder()
+        animated = set()
+
+        for matters in (dseq.rotationMatters, dseq.translationMatters, dseq.scaleMatters):
+            animated.update(animated_nodes(matters, dsq.nodes))
+
+        mapping = [builder.node_index(name) if index in animated else None
+                   for index, name in enumerate(dsq.nodes)]
+        builder.add_sequence(dsq, dseq, mapping)
+
+        output = os.path.join(output_dir, sequence_filename(dseq.name))
+
+        # Names differing only in case are the same file on some systems
+        key = os.path.normcase(output).lower()
+
+        if key in written:
+            raise DsqToolError("Sequences '{}' would be written to the same file".format(dseq.name))
+
+        write_dsq(output, builder.build())
+        written.add(key)
+        paths.append(output)
+
+    return paths
+
+def merge(paths, output):
+    # Joins the sequences of several DSQ files into one, over the union of
+    # their node tables. The files are read one at a time.
+    builder = DsqBuilder()
+
+    for path in paths:
+        dsq = read_dsq(path)
+        mapping = [builder.node_index(name) for name in dsq.nodes]
+
+        for dseq in dsq.sequences:
+            builder.add_sequence(dsq, dseq, mapping)
+
+    write_dsq(output, builder.build())
+    return len(builder.sequences)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split and merge DSQ files without Blender")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    split_parser = commands.add_parser("split", help="Write each sequence of a DSQ to its own file")
+    split_parser.add_argument("dsq", help="DSQ file to split")
+    split_parser.add_argument("output_dir", help="Directory for the sequence files")
+
+    merge_parser = commands.add_parser("merge", help="Join several DSQ files into one")
+    merge_parser.add_argument("dsq", nargs="+", help="DSQ files to merge")
+    merge_parser.add_argument("-o", "--output", required=True, help="DSQ file to write")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "split":
+            paths = split(args.dsq, args.output_dir)
+            print("Wrote {} sequence files to {}".format(len(paths), args.output_dir), file=sys.stderr)
+        else:
+            count = merge(args.dsq, args.output)
+            print("Wrote {} sequences to {}".format(count, args.output), file=sys.stderr)
+    except DsqToolError as e:
+        print("Error:", e, file=sys.stderr)
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
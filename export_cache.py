@@ -0,0 +1,187 @@
+import os
+import time
+import json
+import base64
+import hashlib
+import tempfile
+from array import array
+
+from .DtsTypes import Mesh, Primitive, Vector
+
+# Bump this whenever the way meshes are encoded changes
+cache_version = 3
+
+# Entries not used by any export for this long are dropped, and only the
+# most recently used ones are kept beyond the cap. Several exports may share
+# one cache, so an entry the current export didn't use may still be needed.
+max_entry_age = 30 * 24 * 60 * 60
+max_entries = 4096
+
+# Typecodes of the packed mesh fields stored as raw bytes in the cache file
+array_fields = {
+    "verts": "f",
+    "tverts": "f",
+    "normals": "f",
+    "enormals": "b",
+    "indices": "i",
+    "mindices": "i",
+}
+
+def default_cache_path(blend_filepath, export_filepath):
+    # Keep the cache beside the .blend, or beside the exported file for unsaved scenes
+    if blend_filepath:
+        return os.path.splitext(blend_filepath)[0] + ".dtscache"
+    elif export_filepath:
+        return os.path.splitext(export_filepath)[0] + ".dtscache"
+    else:
+        return os.path.join(tempfile.gettempdir(), "io_scene_dts.dtscache")
+
+def foreach_array(collection, attr, typecode, size):
+    data = array(typecode, bytes(array(typecode).itemsize * len(collection) * size))
+    collection.foreach_get(attr, data)
+    return data
+
+def mesh_digest(mesh, bobj, transform_mat):
+    digest = hashlib.sha1()
+
+    digest.update(foreach_array(mesh.vertices, "co", "f", 3).tobytes())
+    digest.update(foreach_array(mesh.vertices, "normal", "f", 3).tobytes())
+    digest.update(foreach_array(mesh.loops, "vertex_index", "i", 1).tobytes())
+    digest.update(foreach_array(mesh.polygons, "loop_start", "i", 1).tobytes())
+    digest.update(foreach_array(mesh.polygons, "loop_total", "i", 1).tobytes())
+    digest.update(foreach_array(mesh.polygons, "material_index", "i", 1).tobytes())
+
+    use_smooth = [False] * len(mesh.polygons)
+    mesh.polygons.foreach_get("use_smooth", use_smooth)
+    digest.update(bytes(use_smooth))
+
+    if mesh.uv_layers:
+        digest.update(foreach_array(mesh.uv_layers[0].data, "uv", "f", 2).tobytes())
+
+    digest.update(array("f", (f for row in transform_mat for f in row)).tobytes())
+
+    # Material slots only decide the primitive grouping, the materials
+    # themselves are exported on every run
+    names = [mat.name if mat is not None else "" for mat in mesh.materials]
+    modifiers = ["{}:{}".format(modifier.name, modifier.type) for modifier in bobj.modifiers]
+    digest.update("\0".join(names + ["|"] + modifiers).encode("utf-8"))
+
+    return digest.hexdigest()
+
+def flatten(vectors):
+    return array("f", (f for v in vectors for f in v))
+
+def unflatten(data, size):
+    return [Vector(data[i:i + size]) for i in range(0, len(data), size)]
+
+def geometry_digest(dmesh):
+    # Everything a child mesh can take over from its parent
+    digest = hashlib.sha1()
+    digest.update(flatten(dmesh.verts).tobytes())
+    digest.update(flatten(dmesh.tverts).tobytes())
+    digest.update(flatten(dmesh.normals).tobytes())
+    digest.update(array("b", dmesh.enormals).tobytes())
+    return digest.digest()
+
+def pack_mesh(dmesh):
+    return {
+        "type": dmesh.type,
+        "verts": flatten(dmesh.verts),
+        "tverts": flatten(dmesh.tverts),
+        "normals": flatten(dmesh.normals),
+        "enormals": array("b", dmesh.enormals),
+        "primitives": [(p.firstElement, p.numElements, p.type) for p in dmesh.primitives],
+        "material_slots": list(dmesh.material_slots),
+        "indices": array("i", dmesh.indices),
+        "mindices": array("i", dmesh.mindices),
+    }
+
+def unpack_mesh(entry):
+    dmesh = Mesh(entry["type"])
+    dmesh.verts = unflatten(entry["verts"], 3)
+    dmesh.tverts = unflatten(entry["tverts"], 2)
+    dmesh.normals = unflatten(entry["normals"], 3)
+    dmesh.enormals = list(entry["enormals"])
+    dmesh.primitives = [Primitive(*p) for p in entry["primitives"]]
+    dmesh.material_slots = list(entry["material_slots"])
+    dmesh.indices = list(entry["indices"])
+    dmesh.mindices = list(entry["mindices"])
+    dmesh.vertsPerFrame = len(dmesh.verts)
+    return dmesh
+
+def encode_entry(key, digest, packed, last_used):
+    # The cache file is plain JSON with the arrays as base64, so that loading
+    # one found in a shared folder can't run anything
+    fields = dict(packed)
+
+    for name in array_fields:
+        fields[name] = base64.b64encode(packed[name].tobytes()).decode("ascii")
+
+    return {"key": list(key), "digest": digest, "last_used": last_used, "mesh": fields}
+
+def decode_entry(data):
+    packed = dict(data["mesh"])
+
+    for name, typecode in array_fields.items():
+        packed[name] = array(typecode, base64.b64decode(packed[name]))
+
+    packed["primitives"] = [tuple(int(value) for value in p) for p in packed["primitives"]]
+    packed["material_slots"] = [int(slot) for slot in packed["material_slots"]]
+    return tuple(data["key"]), (str(data["digest"]), packed), float(data["last_used"])
+
+class ExportCache:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.entries = {}
+        self.last_used = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+        try:
+            with open(filepath, "r", encoding="utf-8") as fd:
+                data = json.load(fd)
+
+            if data.get("version") == cache_version:
+                for key, entry, last_used in map(decode_entry, data["entries"]):
+                    self.entries[key] = entry
+                    self.last_used[key] = last_used
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("Warning: Ignoring unreadable export cache '{}' ({})".format(filepath, e))
+
+    def get(self, key, digest):
+        self.used.add(key)
+        entry = self.entries.get(key)
+
+        if entry is None or entry[0] != digest:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return unpack_mesh(entry[1])
+
+    def put(self, key, digest, dmesh):
+        self.used.add(key)
+        self.entries[key] = (digest, pack_mesh(dmesh))
+
+    def save(self):
+        now = time.time()
+
+        for key in self.used:
+            self.last_used[key] = now
+
+        keys = sorted((key for key in self.entries if now - self.last_used[key] <= max_entry_age),
+                      key=self.last_used.get, reverse=True)[:max_entries]
+
+        data = {
+            "version": cache_version,
+            "entries": [encode_entry(key, *self.entries[key], self.last_used[key]) for key in keys],
+        }
+
+        try:
+            with open(self.filepath, "w", encoding="utf-8") as fd:
+                json.dump(data, fd)
+        except OSError as e:
+            print("Warning: Could not write export cache '{}' ({})".format(self.filepath, e))
@@ -1,4 +1,4 @@
-import bpy, sys
+import bpy, io, sys
 from math import sqrt, pi
 from operator import attrgetter
 from itertools import groupby
@@ -8,10 +8,39 @@ from .DtsTypes import *
 from .util import fail, evaluate_all, find_reference, array_from_fcurves, \
     array_from_fcurves_rotation, fcurves_keyframe_in_range, find_reference
 from .shared_export import find_seqs
+from .profiler import Profiler, NullProfiler
+from .sequence_util import SequenceKeys, prune_constant_channels, write_sequence_keys, \
+    decimate_sequence_keys, KeyBlockCache
 
 def save(operator, context, filepath,
-         select_marker=False,
-         debug_report=False):
+         profile=False,
+         debug_report=False,
+         **options):
+    profiler = Profiler() if profile else NullProfiler()
+
+    try:
+        result = save_sequences(operator, context, filepath, profiler,
+                                debug_report=debug_report, **options)
+    finally:
+        profiler.close()
+
+    profiler.print_summary()
+
+    if debug_report and result == {"FINISHED"}:
+        with open(filepath + ".txt", "a") as fd:
+            profiler.write_summary(fd)
+
+    return result
+
+def save_sequences(operator, context, filepath, profiler,
+                   select_marker=False,
+                   prune_channels=False,
+                   channel_tolerance=0.0001,
+                   decimate_keys=False,
+                   decimate_rotation_error=0.0087,
+                   decimate_translation_error=0.001,
+                   decimate_scale_error=0.001,
+                   debug_report=False):
     print("Exporting scene to DSQ")
 
     scene = context.scene
@@ -40,9 +69,10 @@ def save(operator, context, filepath,
             if child.type == "EMPTY":
                 traverse_node(child)
 
-    for ob in scene.objects:
-        if ob.type == "EMPTY" and not ob.parent:
-            traverse_node(ob)
+    with profiler.phase("node collection"):
+        for ob in scene.objects:
+            if ob.type == "EMPTY" and not ob.parent:
+                traverse_node(ob)
 
     reference_frame = find_reference(context.scene)
 
@@ -80,115 +110,155 @@ def save(operator, context, filepath,
                 auto_root_index = len(dsq.nodes)
                 dsq.nodes.append("__auto_root__")
 
-    for name, markers in sequences.items():
-        print("Exporting sequence", name)
-
-        if "start" not in markers:
-            return fail(operator, "Missing start marker for sequence '{}'".format(name))
-
-        if "end" not in markers:
-            return fail(operator, "Missing end marker for sequence '{}'".format(name))
-
-        frame_start = markers["start"].frame
-        frame_end = markers["end"].frame
-        frame_range = frame_end - frame_start + 1
-
-        seq = Sequence()
-        seq.name = name
-        seq.flags = Sequence.AlignedScale
-        seq.priority = 1
-
-        seq.toolBegin = frame_start
-        seq.duration = frame_range * (context.scene.render.fps_base / context.scene.render.fps)
-
-        if name in sequence_flags:
-            for part in sequence_flags[name]:
-                flag, *data = part.split(" ", 1)
-                if data: data = data[0]
-
-                if flag == "priority":
-                    seq.priority = int(data)
-                elif flag == "cyclic":
-                    seq.flags |= Sequence.Cyclic
-                elif flag == "blend":
-                    seq.flags |= Sequence.Blend
-                elif flag == "duration":
-                    seq.duration = float(data)
-                else:
-                    print("Warning: Unknown flag '{}' (used by sequence '{}')".format(flag, name))
-
-        seq.numKeyframes = frame_range
-        seq.firstGroundFrame = len(dsq.ground_translations)
-        seq.baseRotation = len(dsq.rotations)
-        seq.baseTranslation = len(dsq.translations)
-        seq.baseScale = len(dsq.aligned_scales)
-        seq.baseObjectState = 0
-        seq.baseDecalState = 0
-        seq.firstTrigger = len(dsq.triggers)
-
-        seq.rotationMatters = [False] * len(dsq.nodes)
-        seq.translationMatters = [False] * len(dsq.nodes)
-        seq.scaleMatters = [False] * len(dsq.nodes)
-        seq.decalMatters = [False] * len(dsq.nodes)
-        seq.iflMatters = [False] * len(dsq.nodes)
-        seq.visMatters = [False] * len(dsq.nodes)
-        seq.frameMatters = [False] * len(dsq.nodes)
-        seq.matFrameMatters = [False] * len(dsq.nodes)
-
-        dsq.sequences.append(seq)
-
-        frame_indices = list(range(frame_start, frame_end + 1))
-
-        # Store all animation data so we don't need to frame_set all over the place
-        animation_data = {frame: {} for frame in frame_indices}
-
-        for frame in frame_indices:
-            scene.frame_set(frame)
+    with profiler.phase("sequence sampling"):
+        key_blocks = KeyBlockCache()
 
-            for ob in animated_nodes:
-                animation_data[frame][ob] = ob.matrix_local.decompose()
+        for name, markers in sequences.items():
+            print("Exporting sequence", name)
+
+            if "start" not in markers:
+                return fail(operator, "Missing start marker for sequence '{}'".format(name))
+
+            if "end" not in markers:
+                return fail(operator, "Missing end marker for sequence '{}'".format(name))
+
+            frame_start = markers["start"].frame
+            frame_end = markers["end"].frame
+            frame_range = frame_end - frame_start + 1
 
-        for ob in animated_nodes:
-            index = node_index[ob]
+            seq = Sequence()
+            seq.name = name
+            seq.flags = Sequence.AlignedScale
+            seq.priority = 1
 
-            base_translation, base_rotation, base_scale = node_transform[ob]
+            seq.toolBegin = frame_start
+            seq.duration = frame_range * (context.scene.render.fps_base / context.scene.render.fps)
 
-            fcurves = ob.animation_data.action.fcurves
+            if name in sequence_flags:
+                for part in sequence_flags[name]:
+                    flag, *data = part.split(" ", 1)
+                    if data: data = data[0]
 
-            curves_rotation = array_from_fcurves_rotation(fcurves, ob)
-            curves_translation = array_from_fcurves(fcurves, "location", 3)
-            curves_scale = array_from_fcurves(fcurves, "scale", 3)
+                    if flag == "priority":
+                        seq.priority = int(data)
+                    elif flag == "cyclic":
+                        seq.flags |= Sequence.Cyclic
+                    elif flag == "blend":
+                        seq.flags |= Sequence.Blend
+                    elif flag == "duration":
+                        seq.duration = float(data)
+                    else:
+                        print("Warning: Unknown flag '{}' (used by sequence '{}')".format(flag, name))
 
-            # Decide what matters by presence of f-curves
-            if curves_rotation and fcurves_keyframe_in_range(curves_rotation, frame_start, frame_end):
-                seq.rotationMatters[index] = True
+            seq.firstGroundFrame = len(dsq.ground_translations)
+            seq.baseObjectState = 0
+            seq.baseDecalState = 0
+            seq.firstTrigger = len(dsq.triggers)
 
-            if curves_translation and fcurves_keyframe_in_range(curves_translation, frame_start, frame_end):
-                seq.translationMatters[index] = True
+            seq.rotationMatters = [False] * len(dsq.nodes)
+            seq.translationMatters = [False] * len(dsq.nodes)
+            seq.scaleMatters = [False] * len(dsq.nodes)
+            seq.decalMatters = [False] * len(dsq.nodes)
+            seq.iflMatters = [False] * len(dsq.nodes)
+            seq.visMatters = [False] * len(dsq.nodes)
+            seq.frameMatters = [False] * len(dsq.nodes)
+            seq.matFrameMatters = [False] * len(dsq.nodes)
 
-            if curves_scale and fcurves_keyframe_in_range(curves_scale, frame_start, frame_end):
-                seq.scaleMatters[index] = True
+            dsq.sequences.append(seq)
+
+            frame_indices = list(range(frame_start, frame_end + 1))
+
+            # Store all animation data so we don't need to frame_set all over the place
+            animation_data = {frame: {} for frame in frame_indices}
+            keys = SequenceKeys(frame_indices)
 
-            # Write the data where it matters
-            # This assumes that animated_nodes is in the same order as shape.nodes
             for frame in frame_indices:
-                translation, rotation, scale = animation_data[frame][ob]
+                scene.frame_set(frame)
+
+                for ob in animated_nodes:
+                    animation_data[frame][ob] = ob.matrix_local.decompose()
+
+            for ob in animated_nodes:
+                index = node_index[ob]
+
+                base_translation, base_rotation, base_scale = node_transform[ob]
+
+                fcurves = ob.animation_data.action.fcurves
+
+                curves_rotation = array_from_fcurves_rotation(fcurves, ob)
+                curves_translation = array_from_fcurves(fcurves, "location", 3)
+                curves_scale = array_from_fcurves(fcurves, "scale", 3)
+
+                # Decide what matters by presence of f-curves
+                if curves_rotation and fcurves_keyframe_in_range(curves_rotation, frame_start, frame_end):
+                    seq.rotationMatters[index] = True
+
+                if curves_translation and fcurves_keyframe_in_range(curves_translation, frame_start, frame_end):
+                    seq.translationMatters[index] = True
+
+                if curves_scale and fcurves_keyframe_in_range(curves_scale, frame_start, frame_end):
+                    seq.scaleMatters[index] = True
+
+                # Sample the data where it matters
+                for frame in frame_indices:
+                    translation, rotation, scale = animation_data[frame][ob]
+
+                    if seq.translationMatters[index]:
+                        if seq.flags & Sequence.Blend:
+                            translation -= base_translation
+                        keys.translations.setdefault(index, []).append(translation)
+
+                    if seq.rotationMatters[index]:
+                        if seq.flags & Sequence.Blend:
+                            rotation = base_rotation.inverted() @ rotation
+                        keys.rotations.setdefault(index, []).append(rotation)
+
+                    if seq.scaleMatters[index]:
+                        keys.scales.setdefault(index, []).append(scale)
+
+            if prune_channels:
+                default_translations = [None] * len(dsq.nodes)
+                default_rotations = [None] * len(dsq.nodes)
+
+                for ob in animated_nodes:
+                    translation, rotation, _ = node_transform[ob]
+                    default_translations[node_index[ob]] = translation
+                    default_rotations[node_index[ob]] = rotation
+
+                pruned, saved = prune_constant_channels(seq, keys,
+                    default_translations, default_rotations, channel_tolerance)
+
+                # A smaller scale type saves bytes without pruning anything
+                if pruned or saved:
+                    print("Pruned {} constant channels from sequence '{}', saving {} bytes"
+                          .format(pruned, name, saved))
+
+            if decimate_keys:
+                old_count = len(keys.frames)
+                new_count = decimate_sequence_keys(seq, keys,
+                    decimate_rotation_error, decimate_translation_error, decimate_scale_error)
+
+                if new_count != old_count:
+                    print("Resampled sequence '{}' from {} to {} keyframes"
+                          .format(name, old_count, new_count))
 
-                if seq.translationMatters[index]:
-                    if seq.flags & Sequence.Blend:
-                        translation -= base_translation
-                    dsq.translations.append(translation)
+            write_sequence_keys(seq, keys,
+                rotations=dsq.rotations,
+                translations=dsq.translations,
+                uniform_scales=dsq.uniform_scales,
+                aligned_scales=dsq.aligned_scales,
+                block_cache=key_blocks)
 
-                if seq.rotationMatters[index]:
-                    if seq.flags & Sequence.Blend:
-                        rotation = base_rotation.inverted() @ rotation
-                    dsq.rotations.append(rotation)
+        if key_blocks.reused_keys:
+            print("Reused {} keys from identical blocks of earlier sequences".format(key_blocks.reused_keys))
 
-                if seq.scaleMatters[index]:
-                    dsq.aligned_scales.append(scale)
+    with profiler.phase("serialization"):
+        buffer = io.BytesIO()
+        dsq.write(buffer)
 
-    with open(filepath, "wb") as fd:
-        dsq.write(fd)
+    with profiler.phase("file write"):
+        with open(filepath, "wb") as fd:
+            fd.write(buffer.getbuffer())
 
     if debug_report:
         with open(filepath + ".txt", "w") as fd:
@@ -1,4 +1,5 @@
-import bpy, bmesh, os, sys
+import bpy, bmesh, io, os, sys
+import numpy as np
 from math import sqrt, pi
 from operator import attrgetter
 from itertools import groupby
@@ -9,6 +10,15 @@ from .write_report import write_debug_report
 from .util import fail, resolve_texture, default_materials, evaluate_all, find_reference, \
     array_from_fcurves, array_from_fcurves_rotation, fcurves_keyframe_in_range
 from .shared_export import find_seqs
+from .profiler import Profiler, NullProfiler
+from .textures import texture_index
+from .bounds import point_array, box_bounds, box_corners, bounding_sphere, tube_radius, set_mesh_bounds
+from .convex_hull import convex_decomposition
+from .lod_util import parse_number_list, triangle_count, mesh_distance_error, mesh_extent, \
+    screen_error_sizes
+from .export_cache import ExportCache, default_cache_path, mesh_digest, geometry_digest
+from .sequence_util import SequenceKeys, prune_constant_channels, write_sequence_keys, \
+    decimate_sequence_keys, KeyBlockCache
 
 import re
 # re really isn't necessary. oh well.
@@ -70,6 +80,84 @@ def add_vertex_influences(ob, armature, node_lookup, mesh, vert, vertex_index):
             get_vertex_bone(mesh, node),
             weight * weight_multiplier))
 
+def material_flags(mesh, material_index, shape, material_table, blank_material):
+    if mesh.materials:
+        bmat = mesh.materials[material_index]
+
+        if bmat not in material_table:
+            material_table[bmat] = export_material(bmat, shape)
+
+        return material_table[bmat] & Primitive.MaterialMask
+    elif blank_material:
+        # The blank material is shared by every mesh without materials
+        if None not in material_table:
+            material_table[None] = len(shape.materials)
+            shape.materials.append(Material(name="blank",
+                flags=Material.SWrap | Material.TWrap | Material.NeverEnvMap))
+
+        return material_table[None] & Primitive.MaterialMask
+    else:
+        return Primitive.NoMaterial
+
+def export_mesh(mesh, bobj, transform_mat, mesh_type, armature, node_lookup):
+    dmesh = Mesh(mesh_type)
+
+    # The material slot used by each primitive
+    dmesh.material_slots = []
+
+    # Group all materials by their material_index
+    key = attrgetter("material_index")
+    grouped_polys = groupby(sorted(mesh.polygons, key=key), key=key)
+    grouped_polys = tuple(map(lambda t: (t[0], tuple(t[1])), grouped_polys))
+
+    if mesh.uv_layers:
+        uv_layer = mesh.uv_layers[0].data
+    else:
+        uv_layer = None
+
+    normal_mat = transform_mat.to_3x3()
+
+    # Create a primitive from each group
+    for material_index, polys in grouped_polys:
+        firstElement = len(dmesh.verts)
+
+        for poly in polys:
+            use_face_normal = not poly.use_smooth
+
+            for vert_index, loop_index in zip(reversed(poly.vertices), reversed(poly.loop_indices)):
+                vertex_index = len(dmesh.verts)
+                dmesh.indices.append(len(dmesh.indices))
+
+                vert = mesh.vertices[vert_index]
+
+                if use_face_normal:
+                    normal = poly.normal
+                else:
+                    normal = vert.normal
+
+                dmesh.verts.append(transform_mat @ vert.co)
+                dmesh.normals.append((normal_mat @ normal).normalized())
+
+                dmesh.enormals.append(0)
+
+                if uv_layer:
+                    uv = uv_layer[loop_index].uv
+                    dmesh.tverts.append(Vector((uv.x, 1 - uv.y)))
+                else:
+                    dmesh.tverts.append(Vector((0, 0)))
+
+                if mesh_type == Mesh.SkinType:
+                    add_vertex_influences(bobj, armature,
+                                          node_lookup, dmesh,
+                                          vert, vertex_index)
+
+        numElements = len(dmesh.verts) - firstElement
+        dmesh.primitives.append(Primitive(firstElement, numElements,
+            Primitive.Triangles | Primitive.Indexed))
+        dmesh.material_slots.append(material_index)
+
+    return dmesh
+
 def export_material(mat, shape):
     # print("Exporting material", mat.name)
 
@@ -353,10 +441,243 @@ def save_meshes(scene, shape, node_lookup, select_object):
         if lod_name in scene_objects[name][1]:
             print("Warning: Multiple objects {} in LOD {}, ignoring...".format(name, lod_name))
         else:
-            scene_objects[name][1][lod_name] = (bobj, transform_mat, armature_modifier)
+            scene_objects[name][1][lod_name] = (bobj, transform_mat, armature_modifier, 1.0)
 
     return scene_lods, scene_objects, bounds_ob
 
+def add_generated_lods(shape, scene_lods, scene_objects, sizes, ratios):
+    # Add detail levels that are decimated copies of the most detailed one.
+    # Returns (generated, source) pairs of detail level names.
+    render_lods = [lod for lod in scene_lods.values() if lod.size >= 0]
+
+    if not render_lods:
+        print("Warning: No detail level to generate LODs from")
+        return []
+
+    top = max(render_lods, key=attrgetter("size"))
+    top_name = shape.names[top.name]
+    generated = []
+
+    for size, ratio in zip(sizes, ratios):
+        if size < 0 or size >= top.size:
+            print("Warning: Generated LOD size {} must be between 0 and the size of '{}' ({}), skipping"
+                  .format(size, top_name, top.size))
+            continue
+
+        if not 0 < ratio < 1:
+            print("Warning: Generated LOD ratio {} must be between 0 and 1, skipping".format(ratio))
+            continue
+
+        lod_name_index, lod_name = shape.name_resolve("detail{}".format(size))
+
+        if lod_name in scene_lods:
+            print("Warning: LOD '{}' already exists, not generating it".format(lod_name))
+            continue
+
+        print("Generating LOD '{}' from '{}' (ratio {})".format(lod_name, top_name, ratio))
+        scene_lods[lod_name] = DetailLevel(name=lod_name_index, subshape=0, objectDetail=-1, size=size)
+        shape.detail_levels.append(scene_lods[lod_name])
+
+        for object, lods in scene_objects.values():
+            if top_name in lods:
+                bobj, transform_mat, armature_modifier, _ = lods[top_name]
+                lods[lod_name] = (bobj, transform_mat, armature_modifier, ratio)
+
+        generated.append((lod_name, top_name))
+
+    return generated
+
+def measure_lod_errors(shape, scene_objects, lod_meshes, generated):
+    for lod_name, source_name in generated:
+        lod = next(lod for lod in shape.detail_levels if shape.names[lod.name] == lod_name)
+
+        error_sum = 0.0
+        weight_sum = 0
+        lod.maxError = 0.0
+
+        for object, lods in scene_objects.values():
+            if (object, lod_name) not in lod_meshes or (object, source_name) not in lod_meshes:
+                continue
+
+            source = lod_meshes[(object, source_name)]
+            target = lod_meshes[(object, lod_name)]
+            avg_error, max_error = mesh_distance_error(source, target)
+
+            # Weigh each object by how much geometry it has
+            weight = triangle_count(source)
+            error_sum += avg_error * weight
+            weight_sum += weight
+            lod.maxError = max(lod.maxError, max_error)
+
+        lod.avgError = error_sum / weight_sum if weight_sum else 0.0
+
+        print("LOD '{}': average error {:.5f}, maximum error {:.5f}"
+              .format(lod_name, lod.avgError, lod.maxError))
+
+def assign_error_lod_sizes(shape, scene_objects, lod_meshes, pixel_error):
+    # Replace the sizes of the render detail levels (which are sorted by
+    # size already) with the smallest ones that keep the visible error of
+    # the next detail level under pixel_error pixels
+    render_lods = [(i, lod) for i, lod in enumerate(shape.detail_levels) if lod.size >= 0]
+
+    if not render_lods:
+        return
+
+    # How far each detail level is from the first one, summed over the steps
+    errors = [0.0]
+
+    for (_, lod), (_, next_lod) in zip(render_lods, render_lods[1:]):
+        lod_name = shape.names[lod.name]
+        next_name = shape.names[next_lod.name]
+        deviation = 0.0
+
+        for object, lods in scene_objects.values():
+            source = lod_meshes.get((object, lod_name))
+            target = lod_meshes.get((object, next_name))
+
+            if source is None and target is None:
+                continue
+            elif source is None:
+                deviation = max(deviation, mesh_extent(target))
+            elif target is None:
+                # The object disappears entirely
+                deviation = max(deviation, mesh_extent(source))
+            else:
+                deviation = max(deviation, mesh_distance_error(source, target)[1])
+
+        errors.append(errors[-1] + deviation)
+
+    sizes = screen_error_sizes([lod.size for _, lod in render_lods],
+                               errors, shape.radius, pixel_error)
+
+    for (_, lod), size in zip(render_lods, sizes):
+        print("LOD '{}': size {} -> {:.1f}".format(shape.names[lod.name], lod.size, size))
+        lod.size = size
+
+    shape.smallest_detail_level, smallest = render_lods[-1]
+    shape.smallest_size = smallest.size
+
+def add_collision_hulls(context, shape, scene_lods, scene_objects,
+                        select_object, apply_modifiers, max_hulls, max_verts):
+    # Build convex hulls around the objects marked with a
+    # 'dts_collision_source' property, or around the most detailed render
+    # LOD, and add them as Col-# objects in a new collision detail level.
+    # Returns the temporary Blender objects holding the hulls.
+    sources = [bobj for bobj in context.scene.objects
+               if bobj.type == "MESH" and bobj.get("dts_collision_source")
+               and (bobj.select_get() or not select_object)]
+
+    if not sources:
+        render_lods = [lod for lod in scene_lods.values() if lod.size >= 0]
+
+        if render_lods:
+            top_name = shape.names[max(render_lods, key=attrgetter("size")).name]
+            sources = [lods[top_name][0] for object, lods in scene_objects.values()
+                       if top_name in lods]
+
+    if not sources:
+        print("Warning: Nothing to generate collision hulls from")
+        return []
+
+    root = next((node for node in shape.nodes if node.parent == -1), None)
+
+    if root is None:
+        print("Warning: No node to attach collision hulls to")
+        return []
+
+    to_root = root.matrix_world.inverted()
+
+    if apply_modifiers:
+        depsgraph = context.evaluated_depsgraph_get()
+
+    points = []
+    faces = []
+
+    for bobj in sources:
+        mesh_owner = bobj.evaluated_get(depsgraph) if apply_modifiers else bobj
+        mesh = mesh_owner.to_mesh()
+        matrix = to_root @ bobj.matrix_world
+
+        offset = len(points)
+        points.extend(matrix @ vert.co for vert in mesh.vertices)
+        faces.extend(tuple(offset + i for i in poly.vertices) for poly in mesh.polygons)
+
+        mesh_owner.to_mesh_clear()
+
+    hulls = convex_decomposition(points, faces, max_hulls, max_verts)
+
+    if not hulls:
+        print("Warning: Could not build any collision hulls (is the source mesh flat?)")
+        return []
+
+    taken = {name.lower() for name in scene_lods}
+    level = 1
+
+    while "collision-{}".format(level) in taken:
+        level += 1
+
+    lod_name_index, lod_name = shape.name_resolve("collision-{}".format(level))
+    print("Creating LOD '{}' (size {}) with {} generated hulls".format(lod_name, -level, len(hulls)))
+    scene_lods[lod_name] = DetailLevel(name=lod_name_index, subshape=0, objectDetail=-1, size=-level)
+    shape.detail_levels.append(scene_lods[lod_name])
+
+    temporary = []
+    index = 1
+
+    for hull in hulls:
+        while "Col-{}".format(index) in scene_objects:
+            index += 1
+
+        name = "Col-{}".format(index)
+
+        # The exporter reads meshes from objects, so give each hull one.
+        # It is never linked to the scene.
+        mesh = bpy.data.meshes.new(name)
+        hull.to_mesh(mesh)
+        hull.free()
+        bobj = bpy.data.objects.new(name, mesh)
+        temporary.append(bobj)
+
+        object = Object(shape.name(name), numMeshes=0, firstMesh=0, node=root.index)
+        object.has_transparency = False
+        shape.objects.append(object)
+        shape.objectstates.append(ObjectState(1.0, 0, 0))
+        scene_objects[name] = (object, {lod_name: (bobj, Matrix.Identity(4), None, 1.0)})
+
+    return temporary
+
+def remove_temporary_objects(temporary):
+    for bobj in temporary:
+        mesh = bobj.data
+        bpy.data.objects.remove(bobj)
+        bpy.data.meshes.remove(mesh)
+
+def share_mesh_geometry(meshes):
+    # Meshes with the same vertex data point at the first one with it
+    # through Mesh.parent instead of storing their own copy
+    first = {}
+    shared = 0
+
+    for index, dmesh in enumerate(meshes):
+        if dmesh.get_type() != Mesh.StandardType:
+            continue
+
+        digest = geometry_digest(dmesh)
+
+        if digest in first:
+            dmesh.parent = first[digest]
+            shared += 1
+        else:
+            first[digest] = index
+
+    return shared
+
+def add_decimate_modifier(bobj, ratio):
+    modifier = bobj.modifiers.new("__dts_lod__", 'DECIMATE')
+    modifier.decimate_type = 'COLLAPSE'
+    modifier.ratio = ratio
+    return modifier
+
 def compute_bounds(shape, bounds_ob):
     print("Computing bounds")
 
@@ -368,14 +689,7 @@ def compute_bounds(shape, bounds_ob):
     #         shape.smallest_size = lod.size
     #         shape.smallest_detail_level = i
 
-    shape.bounds = Box(
-        Vector(( 10e30,  10e30,  10e30)),
-        Vector((-10e30, -10e30, -10e30)))
-
-    shape.center = Vector()
-
-    shape.radius = 0
-    shape.radius_tube = 0
+    arrays = []
 
     for obj in shape.objects:
         for j in range(0, obj.numMeshes):
@@ -384,377 +698,465 @@ def compute_bounds(shape, bounds_ob):
             if mesh.type == Mesh.NullType:
                 continue
 
-            mat = shape.nodes[obj.node].matrix_world
-            bounds = mesh.calculate_bounds_mat(mat)
+            arrays.append(point_array(mesh.verts, shape.nodes[obj.node].matrix_world))
 
-            shape.radius = max(shape.radius, mesh.calculate_radius_mat(mat, shape.center))
-            shape.radius_tube = max(shape.radius_tube, mesh.calculate_radius_tube_mat(mat, shape.center))
-
-            shape.bounds.min.x = min(shape.bounds.min.x, bounds.min.x)
-            shape.bounds.min.y = min(shape.bounds.min.y, bounds.min.y)
-            shape.bounds.min.z = min(shape.bounds.min.z, bounds.min.z)
-            shape.bounds.max.x = max(shape.bounds.max.x, bounds.max.x)
-            shape.bounds.max.y = max(shape.bounds.max.y, bounds.max.y)
-            shape.bounds.max.z = max(shape.bounds.max.z, bounds.max.z)
+    points = np.concatenate(arrays) if arrays else np.zeros((0, 3))
+    shape.bounds = box_bounds(points)
 
     # Is there a bounds mesh? Use that instead.
     if bounds_ob:
-      shape.bounds = Box(Vector(bounds_ob.bound_box[0]), Vector(bounds_ob.bound_box[6]))
+        shape.bounds = Box(Vector(bounds_ob.bound_box[0]), Vector(bounds_ob.bound_box[6]))
+
+        # Keep the whole box inside the bounding sphere too
+        points = np.concatenate((points, box_corners(shape.bounds)))
 
-    shape.center = Vector((
-        (shape.bounds.min.x + shape.bounds.max.x) / 2,
-        (shape.bounds.min.y + shape.bounds.max.y) / 2,
-        (shape.bounds.min.z + shape.bounds.max.z) / 2))
+    shape.center, shape.radius = bounding_sphere(points)
+    shape.radius_tube = tube_radius(points, shape.center)
 
 def save(operator, context, filepath,
-         select_object=False,
-         select_marker=False,
-         blank_material=True,
-         generate_texture="disabled",
-         apply_modifiers=True,
-         debug_report=False):
+         profile=False,
+         debug_report=False,
+         **options):
+    profiler = Profiler() if profile else NullProfiler()
+
+    try:
+        result = save_shape(operator, context, filepath, profiler,
+                            debug_report=debug_report, **options)
+    finally:
+        profiler.close()
+
+    profiler.print_summary()
+
+    if debug_report and result == {"FINISHED"}:
+        with open(filepath + ".txt", "a") as fd:
+            profiler.write_summary(fd)
+
+    return result
+
+def save_shape(operator, context, filepath, profiler,
+               select_object=False,
+               select_marker=False,
+               blank_material=True,
+               generate_texture="disabled",
+               apply_modifiers=True,
+               use_export_cache=False,
+               generate_lods=False,
+               lod_sizes="",
+               lod_ratios="",
+               lod_size_mode="names",
+               lod_pixel_error=1.0,
+               generate_collision=False,
+               collision_hulls=1,
+               collision_hull_verts=32,
+               prune_channels=False,
+               channel_tolerance=0.0001,
+               decimate_keys=False,
+               decimate_rotation_error=0.0087,
+               decimate_translation_error=0.001,
+               decimate_scale_error=0.001,
+               debug_report=False):
     print("Exporting scene to DTS")
 
     scene = context.scene
     active = context.active_object
     shape = DtsShape()
 
-    blank_material_index = None
-
     reference_frame = find_reference(scene)
 
     if reference_frame is not None:
         print("Note: Seeking to reference frame at", reference_frame)
         scene.frame_set(reference_frame)
 
-    node_lookup = save_nodes(scene, shape, select_object)
-    scene_lods, scene_objects, bounds_ob = save_meshes(
-        scene, shape, node_lookup, select_object)
+    with profiler.phase("node collection"):
+        node_lookup = save_nodes(scene, shape, select_object)
+        scene_lods, scene_objects, bounds_ob = save_meshes(
+            scene, shape, node_lookup, select_object)
 
-    # If the shape is empty, add a detail level so it is valid
-    if not shape.detail_levels:
-        dl = DetailLevel(name=shape.name('detail1'), subshape=0, objectDetail=-1, size=1)
-        shape.detail_levels.append(dl)
+    generated_lods = []
 
-    # Put objects with transparent materials last
-    # Note: If this plugin ever needs to do anything with objectstates,
-    #       that needs to be handled properly. a37hm: earch for ff56g
-    shape.objects.sort(key=lambda object: object.has_transparency) # TODO: attrgetter
+    if generate_lods:
+        try:
+            sizes = parse_number_list(lod_sizes, int)
+            ratios = parse_number_list(lod_ratios, float)
+        except ValueError:
+            return fail(operator, "LOD sizes must be whole numbers and LOD ratios decimal numbers")
 
-    # Sort detail levels
-    shape.detail_levels.sort(key=attrgetter("size"), reverse=True)
+        if len(sizes) != len(ratios):
+            return fail(operator, "Got {} LOD sizes but {} LOD ratios".format(len(sizes), len(ratios)))
 
-    for i, lod in enumerate(shape.detail_levels):
-        lod.objectDetail = i # this isn't the right place for this
+        generated_lods = add_generated_lods(shape, scene_lods, scene_objects, sizes, ratios)
+
+    if generate_collision:
+        with profiler.phase("collision hulls"):
+            temporary_objects = add_collision_hulls(context, shape, scene_lods, scene_objects,
+                select_object, apply_modifiers, collision_hulls, collision_hull_verts)
+    else:
+        temporary_objects = []
 
-    print("Adding meshes to objects...")
+    # The collision hull objects must not outlive the export, even when it fails
+    try:
+        # If the shape is empty, add a detail level so it is valid
+        if not shape.detail_levels:
+            dl = DetailLevel(name=shape.name('detail1'), subshape=0, objectDetail=-1, size=1)
+            shape.detail_levels.append(dl)
 
-    material_table = {}
+        # Put objects with transparent materials last
+        # Note: If this plugin ever needs to do anything with objectstates,
+        #       that needs to be handled properly. a37hm: earch for ff56g
+        shape.objects.sort(key=lambda object: object.has_transparency) # TODO: attrgetter
 
-    for object, lods in scene_objects.values():
-        object.firstMesh = len(shape.meshes)
+        # Sort detail levels
+        shape.detail_levels.sort(key=attrgetter("size"), reverse=True)
 
-        for i, lod in enumerate(reversed(shape.detail_levels)):
-            if shape.names[lod.name] in lods:
-                object.numMeshes = len(shape.detail_levels) - i
-                break
+        for i, lod in enumerate(shape.detail_levels):
+            lod.objectDetail = i # this isn't the right place for this
+
+        print("Adding meshes to objects...")
+
+        material_table = {}
+        lod_meshes = {}
+
+        if use_export_cache:
+            cache = ExportCache(default_cache_path(bpy.data.filepath, filepath))
         else:
-            object.numMeshes = 0
-            continue
+            cache = None
 
-        for i in range(object.numMeshes):
-            lod = shape.detail_levels[i]
-            lod_name = shape.names[lod.name]
+        for object, lods in scene_objects.values():
+            object.firstMesh = len(shape.meshes)
 
-            if lod_name in lods:
-                print("Exporting mesh '{}' (LOD '{}')".format(shape.names[object.name], lod_name))
-                bobj, transform_mat, armature_modifier = lods[lod_name]
+            for i, lod in enumerate(reversed(shape.detail_levels)):
+                if shape.names[lod.name] in lods:
+                    object.numMeshes = len(shape.detail_levels) - i
+                    break
+            else:
+                object.numMeshes = 0
+                continue
 
-                if armature_modifier is None:
-                    mesh_type = Mesh.StandardType
-                else:
-                    mesh_type = Mesh.SkinType
-                    armature = armature_modifier.object
-
-                #########################
-                ### Welcome to complexity
-
-                # Disable the armature modifier so it does not deform the mesh
-                # when writing it to the DTS file
-                if armature_modifier is not None:
-                    was_show_render = armature_modifier.show_render
-                    was_show_viewport = armature_modifier.show_viewport
-
-                    armature_modifier.show_render = False
-                    armature_modifier.show_viewport = False
-
-                # gyt: apply modifiers
-                if apply_modifiers:
-                    old_active = bpy.context.view_layer.objects.active # remember the old active object so we don't annoy the living shit out of users
-                    bpy.context.view_layer.objects.active = bobj
-                    for modifier in bobj.modifiers:
-                        bpy.ops.object.modifier_apply(modifier=modifier.name)
-                    bpy.context.view_layer.objects.active = old_active
-
-                mesh = bobj.to_mesh()
-                bm = bmesh.new()
-                bm.from_mesh(mesh)
-                bmesh.ops.triangulate(bm, faces=bm.faces)
-                bm.to_mesh(mesh)
-                bm.free()
-
-                # Restore the armature modifier
-                if armature_modifier is not None:
-                    armature_modifier.show_render = was_show_render
-                    armature_modifier.show_viewport = was_show_viewport
-
-                # This is the danger zone
-                # Data from down here may not stay around!
-
-                dmesh = Mesh(mesh_type)
-                shape.meshes.append(dmesh)
-
-                dmesh.matrix_world = bobj.matrix_world
-
-                dmesh.bounds = dmesh.calculate_bounds_mat(Matrix())
-                #dmesh.center = Vector((
-                #    (dmesh.bounds.min.x + dmesh.bounds.max.x) / 2,
-                #    (dmesh.bounds.min.y + dmesh.bounds.max.y) / 2,
-                #    (dmesh.bounds.min.z + dmesh.bounds.max.z) / 2))
-                dmesh.center = Vector()
-                dmesh.radius = dmesh.calculate_radius_mat(Matrix(), dmesh.center)
-
-                # Group all materials by their material_index
-                key = attrgetter("material_index")
-                grouped_polys = groupby(sorted(mesh.polygons, key=key), key=key)
-                grouped_polys = tuple(map(lambda t: (t[0], tuple(t[1])), grouped_polys))
-
-                # Create a primitive from each group
-                for material_index, polys in grouped_polys:
-                    flags = Primitive.Triangles | Primitive.Indexed
-
-                    if mesh.materials:
-                        bmat = mesh.materials[material_index]
-
-                        if bmat not in material_table:
-                            material_table[bmat] = export_material(bmat, shape)
-
-                        flags |= material_table[bmat] & Primitive.MaterialMask
-                    elif blank_material:
-                        if blank_material_index is None:
-                            blank_material_index = len(shape.materials)
-                            shape.materials.append(Material(name="blank",
-                                flags=Material.SWrap | Material.TWrap | Material.NeverEnvMap))
-
-                        flags |= blank_material_index & Primitive.MaterialMask
-                    else:
-                        flags |= Primitive.NoMaterial
+            for i in range(object.numMeshes):
+                lod = shape.detail_levels[i]
+                lod_name = shape.names[lod.name]
 
-                    firstElement = len(dmesh.verts)
+                if lod_name in lods:
+                    print("Exporting mesh '{}' (LOD '{}')".format(shape.names[object.name], lod_name))
+                    bobj, transform_mat, armature_modifier, ratio = lods[lod_name]
 
-                    for poly in polys:
-                        if mesh.uv_layers:
-                            uv_layer = mesh.uv_layers[0].data
+                    if armature_modifier is None:
+                        mesh_type = Mesh.StandardType
+                        armature = None
+                    else:
+                        mesh_type = Mesh.SkinType
+                        armature = armature_modifier.object
+
+                    #########################
+                    ### Welcome to complexity
+
+                    with profiler.phase("mesh extraction"):
+                        # Disable the armature modifier so it does not deform the mesh
+                        # when writing it to the DTS file
+                        if armature_modifier is not None:
+                            was_show_render = armature_modifier.show_render
+                            was_show_viewport = armature_modifier.show_viewport
+
+                            armature_modifier.show_render = False
+                            armature_modifier.show_viewport = False
+
+                        # Generated LODs are decimated by a temporary modifier, which
+                        # then has to be the only one evaluated if modifiers are off
+                        if ratio < 1.0:
+                            decimate_modifier = add_decimate_modifier(bobj, ratio)
+                            hidden_modifiers = []
+
+                            if not apply_modifiers:
+                                for modifier in bobj.modifiers:
+                                    if modifier != decimate_modifier and modifier.show_viewport:
+                                        modifier.show_viewport = False
+                                        hidden_modifiers.append(modifier)
                         else:
-                            uv_layer = None
+                            decimate_modifier = None
 
-                        use_face_normal = not poly.use_smooth
+                        # Take the mesh with modifiers applied from the evaluated object
+                        # instead of applying them, so the scene is left untouched
+                        if apply_modifiers or decimate_modifier is not None:
+                            depsgraph = context.evaluated_depsgraph_get()
+                            mesh_owner = bobj.evaluated_get(depsgraph)
+                        else:
+                            mesh_owner = bobj
 
-                        for vert_index, loop_index in zip(reversed(poly.vertices), reversed(poly.loop_indices)):
-                            vertex_index = len(dmesh.verts)
-                            dmesh.indices.append(len(dmesh.indices))
+                        mesh = mesh_owner.to_mesh()
 
-                            vert = mesh.vertices[vert_index]
+                        if decimate_modifier is not None:
+                            bobj.modifiers.remove(decimate_modifier)
 
-                            if use_face_normal:
-                                normal = poly.normal
-                            else:
-                                normal = vert.normal
+                            for modifier in hidden_modifiers:
+                                modifier.show_viewport = True
 
-                            dmesh.verts.append(transform_mat @ vert.co)
-                            dmesh.normals.append((transform_mat.to_3x3() @ normal).normalized())
+                        # Restore the armature modifier
+                        if armature_modifier is not None:
+                            armature_modifier.show_render = was_show_render
+                            armature_modifier.show_viewport = was_show_viewport
 
-                            dmesh.enormals.append(0)
+                    # This is the danger zone
+                    # Data from down here may not stay around!
 
-                            if uv_layer:
-                                uv = uv_layer[loop_index].uv
-                                dmesh.tverts.append(Vector((uv.x, 1 - uv.y)))
-                            else:
-                                dmesh.tverts.append(Vector((0, 0)))
+                    dmesh = None
 
-                            if mesh_type == Mesh.SkinType:
-                                add_vertex_influences(bobj, armature,
-                                                      node_lookup, dmesh,
-                                                      vert, vertex_index)
+                    # Skinned meshes depend on the node table, don't cache them
+                    if cache is not None and mesh_type == Mesh.StandardType:
+                        cache_key = (shape.names[object.name], lod_name)
+                        digest = mesh_digest(mesh, bobj, transform_mat)
+                        dmesh = cache.get(cache_key, digest)
 
-                    numElements = len(dmesh.verts) - firstElement
-                    dmesh.primitives.append(Primitive(firstElement, numElements, flags))
+                    if dmesh is None:
+                        with profiler.phase("triangulation"):
+                            bm = bmesh.new()
+                            bm.from_mesh(mesh)
+                            bmesh.ops.triangulate(bm, faces=bm.faces)
+                            bm.to_mesh(mesh)
+                            bm.free()
 
-                # bpy.data.meshes.remove(mesh) # RIP!    gyt: is this needed anymore?
+                        with profiler.phase("mesh extraction"):
+                            dmesh = export_mesh(mesh, bobj, transform_mat, mesh_type, armature, node_lookup)
 
-                # ??? ? ?? ???? ??? ?
-                dmesh.vertsPerFrame = len(dmesh.verts)
+                        if cache is not None and mesh_type == Mesh.StandardType:
+                            cache.put(cache_key, digest, dmesh)
 
-                if len(dmesh.indices) >= 65536:
-                    return fail(operator, "The mesh '{}' has too many vertex indices ({} >= 65536)".format(bobj.name, len(dmesh.indices)))
+                    shape.meshes.append(dmesh)
+                    lod_meshes[(object, lod_name)] = dmesh
 
-                ### Nobody leaves Hotel California
-            else:
-                # print("Adding Null mesh for object {} in LOD {}".format(shape.names[object.name], lod_name))
-                shape.meshes.append(Mesh(Mesh.NullType))
+                    dmesh.matrix_world = bobj.matrix_world
+
+                    with profiler.phase("bounds"):
+                        set_mesh_bounds(dmesh)
+
+                    with profiler.phase("material export"):
+                        # Resolve the material slot of each primitive to a DTS material
+                        for prim, material_index in zip(dmesh.primitives, dmesh.material_slots):
+                            prim.type |= material_flags(mesh, material_index, shape,
+                                                        material_table, blank_material)
+
+                    # Free the temporary mesh, nothing may use it past this point
+                    mesh_owner.to_mesh_clear()
+
+                    # ??? ? ?? ???? ??? ?
+                    dmesh.vertsPerFrame = len(dmesh.verts)
+
+                    if len(dmesh.indices) >= 65536:
+                        return fail(operator, "The mesh '{}' has too many vertex indices ({} >= 65536)".format(bobj.name, len(dmesh.indices)))
+
+                    ### Nobody leaves Hotel California
+                else:
+                    # print("Adding Null mesh for object {} in LOD {}".format(shape.names[object.name], lod_name))
+                    shape.meshes.append(Mesh(Mesh.NullType))
+    finally:
+        remove_temporary_objects(temporary_objects)
+
+    shared = share_mesh_geometry(shape.meshes)
+
+    if shared:
+        print("{} meshes share the geometry of an earlier mesh".format(shared))
+
+    for i, lod in enumerate(shape.detail_levels):
+        lod.polyCount = sum(triangle_count(shape.meshes[object.firstMesh + i])
+                            for object in shape.objects if i < object.numMeshes)
+
+    if generated_lods:
+        with profiler.phase("lod errors"):
+            measure_lod_errors(shape, scene_objects, lod_meshes, generated_lods)
+
+    if cache is not None:
+        print("Export cache: {} meshes reused, {} exported".format(cache.hits, cache.misses))
+        cache.save()
 
     print("Creating subshape with " + str(len(shape.nodes)) + " nodes and " + str(len(shape.objects)) + " objects")
     shape.subshapes.append(Subshape(0, 0, 0, len(shape.nodes), len(shape.objects), 0))
 
     # Figure out all the things
-    compute_bounds(shape, bounds_ob)
+    with profiler.phase("bounds"):
+        compute_bounds(shape, bounds_ob)
+
+    if lod_size_mode == "error":
+        with profiler.phase("lod errors"):
+            assign_error_lod_sizes(shape, scene_objects, lod_meshes, lod_pixel_error)
+
+    with profiler.phase("sequence sampling"):
+        sequences, sequence_flags = find_seqs(context.scene, select_marker)
+        key_blocks = KeyBlockCache()
+
+        for name, markers in sequences.items():
+            print("Exporting sequence", name)
+
+            if "start" not in markers:
+                return fail(operator, "Missing start marker for sequence '{}'".format(name))
+
+            if "end" not in markers:
+                return fail(operator, "Missing end marker for sequence '{}'".format(name))
+
+            frame_start = markers["start"].frame
+            frame_end = markers["end"].frame
+            frame_range = frame_end - frame_start + 1
+
+            seq = Sequence()
+            seq.nameIndex = shape.name(name)
+            seq.flags = Sequence.AlignedScale
+            seq.priority = 1
+
+            seq.toolBegin = frame_start
+            seq.duration = frame_range * (context.scene.render.fps_base / context.scene.render.fps)
+
+            if name in sequence_flags:
+                for part in sequence_flags[name]:
+                    flag, *data = part.split(" ", 1)
+                    if data: data = data[0]
+
+                    if flag == "priority":
+                        seq.priority = int(data)
+                    elif flag == "cyclic":
+                        seq.flags |= Sequence.Cyclic
+                    elif flag == "blend":
+                        seq.flags |= Sequence.Blend
+                    elif flag == "duration":
+                        seq.duration = float(data)
+                    else:
+                        print("Warning: Unknown flag '{}' (used by sequence '{}')".format(flag, name))
 
-    sequences, sequence_flags = find_seqs(context.scene, select_marker)
+            seq.firstGroundFrame = len(shape.ground_translations)
+            seq.baseDecalState = len(shape.decalstates)
+            seq.firstTrigger = len(shape.triggers)
 
-    for name, markers in sequences.items():
-        print("Exporting sequence", name)
+            seq.rotationMatters = [False] * len(shape.nodes)
+            seq.translationMatters = [False] * len(shape.nodes)
+            seq.scaleMatters = [False] * len(shape.nodes)
+            seq.decalMatters = [False] * len(shape.nodes)
+            seq.iflMatters = [False] * len(shape.nodes)
+            seq.visMatters = [False] * len(shape.nodes)
+            seq.frameMatters = [False] * len(shape.nodes)
+            seq.matFrameMatters = [False] * len(shape.nodes)
 
-        if "start" not in markers:
-            return fail(operator, "Missing start marker for sequence '{}'".format(name))
+            shape.sequences.append(seq)
 
-        if "end" not in markers:
-            return fail(operator, "Missing end marker for sequence '{}'".format(name))
+            frame_indices = list(range(frame_start, frame_end + 1))
 
-        frame_start = markers["start"].frame
-        frame_end = markers["end"].frame
-        frame_range = frame_end - frame_start + 1
+            # Store all animation data so we don't need to frame_set all over the place
+            animation_data = {frame: {} for frame in frame_indices}
+            keys = SequenceKeys(frame_indices)
 
-        seq = Sequence()
-        seq.nameIndex = shape.name(name)
-        seq.flags = Sequence.AlignedScale
-        seq.priority = 1
+            for frame in frame_indices:
+                scene.frame_set(frame)
 
-        seq.toolBegin = frame_start
-        seq.duration = frame_range * (context.scene.render.fps_base / context.scene.render.fps)
+                for node in shape.nodes:
+                    if hasattr(node, "animation_data") == True and node.armature is not None:
+                        continue
 
-        if name in sequence_flags:
-            for part in sequence_flags[name]:
-                flag, *data = part.split(" ", 1)
-                if data: data = data[0]
+                    if hasattr(node, "bl_ob") == False or node.bl_ob is None:
+                        vis = 1.0
+                    else:
+                        vis = node.bl_ob.torque_vis_props.vis_value
 
-                if flag == "priority":
-                    seq.priority = int(data)
-                elif flag == "cyclic":
-                    seq.flags |= Sequence.Cyclic
-                elif flag == "blend":
-                    seq.flags |= Sequence.Blend
-                elif flag == "duration":
-                    seq.duration = float(data)
-                else:
-                    print("Warning: Unknown flag '{}' (used by sequence '{}')".format(flag, name))
-
-        seq.numKeyframes = frame_range
-        seq.firstGroundFrame = len(shape.ground_translations)
-        seq.baseRotation = len(shape.node_rotations)
-        seq.baseTranslation = len(shape.node_translations)
-        seq.baseScale = len(shape.node_aligned_scales)
-        seq.baseObjectState = len(shape.objectstates)
-        seq.baseDecalState = len(shape.decalstates)
-        seq.firstTrigger = len(shape.triggers)
-
-        seq.rotationMatters = [False] * len(shape.nodes)
-        seq.translationMatters = [False] * len(shape.nodes)
-        seq.scaleMatters = [False] * len(shape.nodes)
-        seq.decalMatters = [False] * len(shape.nodes)
-        seq.iflMatters = [False] * len(shape.nodes)
-        seq.visMatters = [False] * len(shape.nodes)
-        seq.frameMatters = [False] * len(shape.nodes)
-        seq.matFrameMatters = [False] * len(shape.nodes)
-
-        shape.sequences.append(seq)
-
-        frame_indices = list(range(frame_start, frame_end + 1))
-
-        # Store all animation data so we don't need to frame_set all over the place
-        animation_data = {frame: {} for frame in frame_indices}
-
-        for frame in frame_indices:
-            scene.frame_set(frame)
-
-            for node in shape.nodes:
-                if hasattr(node, "animation_data") == True and node.armature is not None:
+                    animation_data[frame][node] = node.matrix.decompose() + (vis,)
+
+            for ob in shape.nodes:
+                if hasattr(ob, "animation_data") == True and ob.armature is not None:
                     continue
 
-                if hasattr(node, "bl_ob") == False or node.bl_ob is None:
-                    vis = 1.0
-                else:
-                    vis = node.bl_ob.torque_vis_props.vis_value
+                # index = node_lookup[ob].index
+                index = ob.index
+                node = shape.nodes[index]
 
-                animation_data[frame][node] = node.matrix.decompose() + (vis,)
+                base_translation, base_rotation, _ = node.matrix.decompose()
+                base_scale = Vector((1.0, 1.0, 1.0))
 
-        for ob in shape.nodes:
-            if hasattr(ob, "animation_data") == True and ob.armature is not None:
-                continue
+                vis = 1.0
+                if hasattr(node, "bl_ob") == True and node.bl_ob is not None:
+                    vis = ob.bl_ob.get("torque_vis_props.vis_value", 1.0)
 
-            # index = node_lookup[ob].index
-            index = ob.index
-            node = shape.nodes[index]
+                base_object_state = ObjectState(vis, 0, 0)
 
-            base_translation, base_rotation, _ = node.matrix.decompose()
-            base_scale = Vector((1.0, 1.0, 1.0))
+                if hasattr(ob, "animation_data") == True and ob.animation_data is not None and ob.animation_data.action is not None:
+                    fcurves = ob.animation_data.action.fcurves
 
-            vis = 1.0
-            if hasattr(node, "bl_ob") == True and node.bl_ob is not None:
-                vis = ob.bl_ob.get("torque_vis_props.vis_value", 1.0)
+                    curves_rotation = array_from_fcurves_rotation(fcurves, ob)
+                    curves_translation = array_from_fcurves(fcurves, "location", 3)
+                    curves_scale = array_from_fcurves(fcurves, "scale", 3)
+                    curves_vis = array_from_fcurves(fcurves, "torque_vis_props.vis_value", 1)
 
-            base_object_state = ObjectState(vis, 0, 0)
+                    # Decide what matters by presence of f-curves
+                    if curves_rotation and fcurves_keyframe_in_range(curves_rotation, frame_start, frame_end):
+                        seq.rotationMatters[index] = True
 
-            if hasattr(ob, "animation_data") == True and ob.animation_data is not None and ob.animation_data.action is not None:
-                fcurves = ob.animation_data.action.fcurves
+                    if curves_translation and fcurves_keyframe_in_range(curves_translation, frame_start, frame_end):
+                        seq.translationMatters[index] = True
 
-                curves_rotation = array_from_fcurves_rotation(fcurves, ob)
-                curves_translation = array_from_fcurves(fcurves, "location", 3)
-                curves_scale = array_from_fcurves(fcurves, "scale", 3)
-                curves_vis = array_from_fcurves(fcurves, "torque_vis_props.vis_value", 1)
+                    if curves_scale and fcurves_keyframe_in_range(curves_scale, frame_start, frame_end):
+                        seq.scaleMatters[index] = True
 
-                # Decide what matters by presence of f-curves
-                if curves_rotation and fcurves_keyframe_in_range(curves_rotation, frame_start, frame_end):
-                    seq.rotationMatters[index] = True
+                    if curves_vis and fcurves_keyframe_in_range(curves_vis, frame_start, frame_end):
+                        seq.visMatters[index] = True
 
-                if curves_translation and fcurves_keyframe_in_range(curves_translation, frame_start, frame_end):
-                    seq.translationMatters[index] = True
+                    # Sample the data where it matters
+                    for frame in frame_indices:
+                        translation, rotation, scale, vis = animation_data[frame][ob]
 
-                if curves_scale and fcurves_keyframe_in_range(curves_scale, frame_start, frame_end):
-                    seq.scaleMatters[index] = True
+                        if seq.translationMatters[index]:
+                            if seq.flags & Sequence.Blend:
+                                translation -= base_translation
+                            keys.translations.setdefault(index, []).append(translation)
 
-                if curves_vis and fcurves_keyframe_in_range(curves_vis, frame_start, frame_end):
-                    seq.visMatters[index] = True
+                        if seq.rotationMatters[index]:
+                            if seq.flags & Sequence.Blend:
+                                rotation = base_rotation.inverted() @ rotation
+                            keys.rotations.setdefault(index, []).append(rotation)
 
-                # Write the data where it matters
-                for frame in frame_indices:
-                    translation, rotation, scale, vis = animation_data[frame][ob]
+                        if seq.scaleMatters[index]:
+                            keys.scales.setdefault(index, []).append(scale)
 
-                    if seq.translationMatters[index]:
-                        if seq.flags & Sequence.Blend:
-                            translation -= base_translation
-                        shape.node_translations.append(translation)
+                        if seq.visMatters[index]:
+                            keys.vis.setdefault(index, []).append(vis)
 
-                    if seq.rotationMatters[index]:
-                        if seq.flags & Sequence.Blend:
-                            rotation = base_rotation.inverted() @ rotation
-                        shape.node_rotations.append(rotation)
+            if prune_channels:
+                pruned, saved = prune_constant_channels(seq, keys,
+                    shape.default_translations, shape.default_rotations, channel_tolerance)
 
-                    if seq.scaleMatters[index]:
-                        shape.node_aligned_scales.append(scale)
+                # A smaller scale type saves bytes without pruning anything
+                if pruned or saved:
+                    print("Pruned {} constant channels from sequence '{}', saving {} bytes"
+                          .format(pruned, name, saved))
 
-                    if seq.visMatters[index]:
-                        shape.objectstates.append(ObjectState(vis, frame, 0))
+            if decimate_keys:
+                old_count = len(keys.frames)
+                new_count = decimate_sequence_keys(seq, keys,
+                    decimate_rotation_error, decimate_translation_error, decimate_scale_error)
+
+                if new_count != old_count:
+                    print("Resampled sequence '{}' from {} to {} keyframes"
+                          .format(name, old_count, new_count))
+
+            write_sequence_keys(seq, keys,
+                rotations=shape.node_rotations,
+                translations=shape.node_translations,
+                uniform_scales=shape.node_uniform_scales,
+                aligned_scales=shape.node_aligned_scales,
+                objectstates=shape.objectstates,
+                block_cache=key_blocks)
+
+        if key_blocks.reused_keys:
+            print("Reused {} keys from identical blocks of earlier sequences".format(key_blocks.reused_keys))
 
     if debug_report:
         print("Writing debug report")
         write_debug_report(filepath + ".txt", shape)
 
-    shape.verify()
+    with profiler.phase("serialization"):
+        shape.verify()
+
+        buffer = io.BytesIO()
+        shape.save(buffer)
 
-    with open(filepath, "wb") as fd:
-        shape.save(fd)
+    with profiler.phase("file write"):
+        with open(filepath, "wb") as fd:
+            fd.write(buffer.getbuffer())
 
-    write_material_textures(generate_texture, filepath, shape)
+    with profiler.phase("material export"):
+        write_material_textures(generate_texture, filepath, shape)
 
     return {"FINISHED"}
 
@@ -765,6 +1167,9 @@ def write_material_textures(mode, filepath, shape):
     f_lookup = mode in ("custom-missing", "all-missing")
     f_custom = mode in ("custom-missing", "custom-always")
 
+    # Textures may have been added since the directories were last listed
+    texture_index.new_generation()
+
     for material in shape.materials:
         if not hasattr(material, "bl_mat"):
             continue
@@ -796,8 +1201,14 @@ def write_material_textures(mode, filepath, shape):
 
             print("Using viewport color")
 
+        texture_path = os.path.join(os.path.dirname(filepath), material.name + ".png")
+
+        # Only missing textures are generated, never replace one on disk
+        if f_lookup and os.path.exists(texture_path):
+            continue
+
         image = bpy.data.images.new(material.name.lower() + "_generated", 16, 16)
         image.pixels = (new_color[0], new_color[1], new_color[2], 1.0) * 256
-        image.filepath_raw = os.path.join(os.path.dirname(filepath), material.name + ".png")
+        image.filepath_raw = texture_path
         image.file_format = "PNG"
         image.save()
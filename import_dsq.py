@@ -1,10 +1,12 @@
 import bpy
+import numpy as np
 from math import ceil
 
-from .DsqFile import DsqFile
-from .DtsTypes import Sequence, Quaternion, Vector
+from .DsqFile import DsqFile, decode_quats
+from .DtsTypes import Sequence, Quaternion
 from .util import fail, ob_location_curves, ob_scale_curves, ob_rotation_curves, ob_rotation_data, \
-  evaluate_all, find_reference
+  evaluate_all, find_reference, KeyframeBuffer
+from .profiler import Profiler, NullProfiler
 
 def get_free_name(name, taken):
   if name not in taken:
@@ -26,43 +28,67 @@ def get_free_name(name, taken):
 # action.fcurves[].keyframe_points[].co
 
 def load(operator, context, filepath,
-         debug_report=False):
-  dsq = DsqFile()
+         profile=False,
+         debug_report=False,
+         dsq=None):
+  profiler = Profiler() if profile else NullProfiler()
 
-  with open(filepath, "rb") as fd:
-    dsq.read(fd)
+  try:
+    result = load_sequences(operator, context, filepath, profiler, debug_report, dsq)
+  finally:
+    profiler.close()
+
+  profiler.print_summary()
+
+  if debug_report and result == {"FINISHED"}:
+    with open(filepath + ".txt", "a") as fd:
+      profiler.write_summary(fd)
+
+  return result
+
+def load_sequences(operator, context, filepath, profiler,
+                   debug_report=False,
+                   dsq=None):
+  # dsq may already have been parsed from filepath, see parallel_import
+  if dsq is None:
+    dsq = DsqFile()
+
+    with profiler.phase("parsing"):
+      with open(filepath, "rb") as fd:
+        dsq.read(fd)
 
   if debug_report:
       with open(filepath + ".txt", "w") as fd:
         dsq.write_dump(fd)
 
-  print("Resolving nodes...")
+  with profiler.phase("node resolution"):
+    print("Resolving nodes...")
 
-  found_obs = {}
+    found_obs = {}
 
-  # Find all our candidate nodes
-  # DSQ is case-insensitive, that's why we can't just [] lookup
-  for ob in context.scene.objects:
-    if ob.type in ("EMPTY", "ARMATURE"):
-      name = ob.name.lower()
+    # Find all our candidate nodes
+    # DSQ is case-insensitive, that's why we can't just [] lookup
+    for ob in context.scene.objects:
+      if ob.type in ("EMPTY", "ARMATURE"):
+        name = ob.name.lower()
 
-      if name in found_obs:
-        print("Warning: Nodes with varying capitalization found ('{}', '{}'), ignoring second".format(found_obs[name].name, ob.name))
-        continue
+        if name in found_obs:
+          print("Warning: Nodes with varying capitalization found ('{}', '{}'), ignoring second".format(found_obs[name].name, ob.name))
+          continue
 
-      found_obs[name] = ob
+        found_obs[name] = ob
 
-  nodes = [None] * len(dsq.nodes)
-  node_missing = []
+    nodes = [None] * len(dsq.nodes)
+    node_missing = []
 
-  # Now associate DSQ node indices with Blender objects
-  for index, name in enumerate(dsq.nodes):
-    lower = name.lower()
+    # Now associate DSQ node indices with Blender objects
+    for index, name in enumerate(dsq.nodes):
+      lower = name.lower()
 
-    if lower in found_obs:
-      nodes[index] = found_obs[lower]
-    else:
-      node_missing.append(name)
+      if lower in found_obs:
+        nodes[index] = found_obs[lower]
+      else:
+        node_missing.append(name)
 
   if node_missing:
     return fail(operator, "The following nodes from the DSQ file could not be found in your scene:\n" + ", ".join(node_missing))
@@ -98,96 +124,90 @@ def load(operator, context, filepath,
   reference_frame = find_reference(context.scene)
 
   # Create Blender keyframes and markers for each sequence
-  for seq in dsq.sequences:
-    name = get_free_name(seq.name, scene_sequences)
-    print("found seq", seq.name, "to", name)
+  keyframes = KeyframeBuffer()
+
+  with profiler.phase("sequence import"):
+    for seq in dsq.sequences:
+      name = get_free_name(seq.name, scene_sequences)
+      print("found seq", seq.name, "to", name)
 
-    flags = []
-    flags.append("priority {}".format(seq.priority))
+      flags = []
+      flags.append("priority {}".format(seq.priority))
 
-    if seq.flags & Sequence.Cyclic:
-      flags.append("cyclic")
+      if seq.flags & Sequence.Cyclic:
+        flags.append("cyclic")
 
-    if seq.flags & Sequence.Blend:
-      flags.append("blend")
+      if seq.flags & Sequence.Blend:
+        flags.append("blend")
 
-    flags.append("duration {}".format(seq.duration))
+      flags.append("duration {}".format(seq.duration))
 
-    if flags:
-      sequences_text.append(name + ": " + ", ".join(flags))
+      if flags:
+        sequences_text.append(name + ": " + ", ".join(flags))
 
-    nodesRotation = tuple(map(lambda p: p[0], filter(lambda p: p[1], zip(nodes, seq.rotationMatters))))
-    nodesTranslation = tuple(map(lambda p: p[0], filter(lambda p: p[1], zip(nodes, seq.translationMatters))))
-    nodesScale = tuple(map(lambda p: p[0], filter(lambda p: p[1], zip(nodes, seq.scaleMatters))))
+      nodesRotation = tuple(map(lambda p: p[0], filter(lambda p: p[1], zip(nodes, seq.rotationMatters))))
+      nodesTranslation = tuple(map(lambda p: p[0], filter(lambda p: p[1], zip(nodes, seq.translationMatters))))
+      nodesScale = tuple(map(lambda p: p[0], filter(lambda p: p[1], zip(nodes, seq.scaleMatters))))
 
-    step = 1
+      step = 1
+      frames = [last_frame + frameIndex * step for frameIndex in range(seq.numKeyframes)]
 
-    for mattersIndex, ob in enumerate(nodesTranslation):
-      curves = ob_location_curves(ob)
+      if seq.flags & Sequence.Blend and reference_frame is None and \
+          (nodesTranslation or nodesRotation):
+        keyframes.flush()
+        return fail(operator, "Missing 'reference' marker for blend animation '{}'".format(name))
+
+      for mattersIndex, ob in enumerate(nodesTranslation):
+        curves = ob_location_curves(ob)
+        base = seq.baseTranslation + mattersIndex * seq.numKeyframes
+        vecs = dsq.translations[base:base + seq.numKeyframes]
 
-      for frameIndex in range(seq.numKeyframes):
-        vec = dsq.translations[seq.baseTranslation + mattersIndex * seq.numKeyframes + frameIndex]
         if seq.flags & Sequence.Blend:
-          if reference_frame is None:
-            return fail(operator, "Missing 'reference' marker for blend animation '{}'".format(name))
-          ref_vec = Vector(evaluate_all(curves, reference_frame))
-          vec = ref_vec + vec
-
-        for curve in curves:
-          curve.keyframe_points.add(1)
-          key = curve.keyframe_points[-1]
-          key.interpolation = "LINEAR"
-          key.co = (last_frame + frameIndex * step, vec[curve.array_index])
-
-    for mattersIndex, ob in enumerate(nodesRotation):
-      mode, curves = ob_rotation_curves(ob)
-
-      for frameIndex in range(seq.numKeyframes):
-        rot = dsq.rotations[seq.baseRotation + mattersIndex * seq.numKeyframes + frameIndex]
+          ref_vec = np.array(evaluate_all(curves, reference_frame))
+          vecs = vecs + ref_vec
+
+        keyframes.add_array(curves, frames, vecs)
+
+      for mattersIndex, ob in enumerate(nodesRotation):
+        mode, curves = ob_rotation_curves(ob)
+        base = seq.baseRotation + mattersIndex * seq.numKeyframes
+        # w, x, y, z rows can go straight into quaternion curves
+        rots = decode_quats(dsq.rotations[base:base + seq.numKeyframes])
+
         if seq.flags & Sequence.Blend:
-          if reference_frame is None:
-            return fail(operator, "Missing 'reference' marker for blend animation '{}'".format(name))
           ref_rot = Quaternion(evaluate_all(curves, reference_frame))
-          rot = ref_rot @ rot
+          rots = [ref_rot @ Quaternion(rot) for rot in rots]
+
         if mode == 'AXIS_ANGLE':
-          rot = rot.to_axis_angle()
+          rots = [Quaternion(rot).to_axis_angle() for rot in rots]
         elif mode != 'QUATERNION':
-          rot = rot.to_euler(mode)
-
-        for curve in curves:
-          curve.keyframe_points.add(1)
-          key = curve.keyframe_points[-1]
-          key.interpolation = "LINEAR"
-          key.co = (last_frame + frameIndex * step, rot[curve.array_index])
+          rots = [Quaternion(rot).to_euler(mode) for rot in rots]
 
-    for mattersIndex, ob in enumerate(nodesScale):
-      curves = ob_scale_curves(ob)
+        keyframes.add_array(curves, frames, rots)
 
-      for frameIndex in range(seq.numKeyframes):
-        index = seq.baseScale + mattersIndex * seq.numKeyframes + frameIndex
+      for mattersIndex, ob in enumerate(nodesScale):
+        curves = ob_scale_curves(ob)
+        base = seq.baseScale + mattersIndex * seq.numKeyframes
 
         if seq.flags & Sequence.UniformScale:
-          s = dsq.uniform_scales[index]
-          scale = s, s, s
+          scales = np.repeat(dsq.uniform_scales[base:base + seq.numKeyframes, None], 3, axis=1)
         elif seq.flags & Sequence.AlignedScale:
-          scale = dsq.aligned_scales[index]
+          scales = dsq.aligned_scales[base:base + seq.numKeyframes]
         elif seq.flags & Sequence.ArbitraryScale:
           print("Warning: Arbitrary scale animation not implemented")
-          break
+          continue
         else:
           print("Warning: Invalid scale flags found in sequence")
-          break
+          continue
+
+        keyframes.add_array(curves, frames, scales)
 
-        for curve in curves:
-          curve.keyframe_points.add(1)
-          key = curve.keyframe_points[-1]
-          key.interpolation = "LINEAR"
-          key.co = (last_frame + frameIndex * step, scale[curve.array_index])
+      context.scene.timeline_markers.new(name + ":start", frame=last_frame)
+      context.scene.timeline_markers.new(name + ":end", frame=(last_frame + seq.numKeyframes))
 
-    context.scene.timeline_markers.new(name + ":start", frame=last_frame)
-    context.scene.timeline_markers.new(name + ":end", frame=(last_frame + seq.numKeyframes))
+      last_frame += seq.numKeyframes + 10
 
-    last_frame += seq.numKeyframes + 10
+    keyframes.flush()
 
   if "Sequences" in bpy.data.texts:
     sequences_buf = bpy.data.texts["Sequences"]
@@ -1,23 +1,42 @@
 import bpy
 import os
-from bpy_extras.io_utils import unpack_list
+import time
+import numpy as np
 
 from .DtsShape import DtsShape
 from .DtsTypes import *
 from .write_report import write_debug_report
+from .primitives import decode_primitives
+from .profiler import Profiler, NullProfiler
+from .textures import texture_index
 from .util import default_materials, resolve_texture, get_rgb_colors, fail, \
-    ob_location_curves, ob_scale_curves, ob_rotation_curves, ob_vis_curves, ob_rotation_data, evaluate_all
+    ob_location_curves, ob_scale_curves, ob_rotation_curves, ob_vis_curves, ob_rotation_data, evaluate_all, \
+    KeyframeBuffer
 
 import operator
-from itertools import zip_longest, count
+from itertools import count
+from collections import defaultdict
 from functools import reduce
 from random import random
 
-def grouper(iterable, n, fillvalue=None):
-    "Collect data into fixed-length chunks or blocks"
-    # grouper('ABCDEFG', 3, 'x') --> ABC DEF Gxx"
-    args = [iter(iterable)] * n
-    return zip_longest(*args, fillvalue=fillvalue)
+def solid_color(image, chunk=1024):
+    # The color of an image that is a single color, otherwise None
+    channels = image.channels
+    pixels = np.empty(image.size[0] * image.size[1] * channels, dtype=np.float32)
+
+    if not len(pixels):
+        return None
+
+    image.pixels.foreach_get(pixels)
+    pixels = pixels.reshape(-1, channels)
+    first = pixels[0]
+
+    # Stop at the first chunk that has a different pixel
+    for start in range(0, len(pixels), chunk):
+        if not (pixels[start:start + chunk] == first).all():
+            return None
+
+    return tuple(float(c) for c in first)
 
 def dedup_name(group, name):
     if name not in group:
@@ -35,13 +54,16 @@ def import_material(color_source, dmat, filepath):
     bmat.roughness = 1
 
     texname = resolve_texture(filepath, dmat.name)
+    teximg = None
 
     if texname is not None:
+        # Materials sharing a texture share the image too
         try:
-            teximg = bpy.data.images.load(texname)
-        except:
+            teximg = bpy.data.images.load(texname, check_existing=True)
+        except RuntimeError:
             print("Cannot load image", texname)
 
+    if teximg is not None:
         #texslot = bmat.texture_paint_slots.add()
         #texslot.use_map_alpha = True
         #tex = texslot.texture = bpy.data.textures.new(dmat.name, "IMAGE")
@@ -54,17 +76,9 @@ def import_material(color_source, dmat, filepath):
 
         # Try to figure out a diffuse color for solid shading
         if teximg.size[0] <= 16 and teximg.size[1] <= 16:
-            if teximg.alpha_mode != "NONE":
-                pixels = grouper(teximg.pixels, 4)
-            else:
-                pixels = grouper(teximg.pixels, 3)
+            color = solid_color(teximg)
 
-            color = pixels.__next__()
-
-            for other in pixels:
-                if other != color:
-                    break
-            else:
+            if color is not None:
                 bmat.diffuse_color = color[:3] + (1,)
     elif dmat.name.lower() in default_materials:
         bmat.diffuse_color = default_materials[dmat.name.lower()]
@@ -100,78 +114,46 @@ def import_material(color_source, dmat, filepath):
 
     return bmat
 
-class index_pass:
-    def __getitem__(self, item):
-        return item
-
 def create_bobj(context, dmesh, materials, shape, obj):
     me = bpy.data.meshes.new("Mesh")
 
-    faces = []
-    material_indices = {}
+    faces, face_materials = decode_primitives(dmesh.primitives, dmesh.indices)
 
-    indices_pass = index_pass()
+    # Give each DTS material used by the mesh a slot,
+    # the extra entry at the end catches faces without one (-1)
+    slots = np.zeros(len(shape.materials) + 1, dtype=np.int32)
 
-    for prim in dmesh.primitives:
-        if prim.type & Primitive.Indexed:
-            indices = dmesh.indices
-        else:
-            indices = indices_pass
+    for material in np.unique(face_materials):
+        if material >= 0:
+            slots[material] = len(me.materials)
+            me.materials.append(materials[shape.materials[material]])
 
-        dmat = None
+    face_materials = slots[face_materials]
 
-        if not (prim.type & Primitive.NoMaterial):
-            dmat = shape.materials[prim.type & Primitive.MaterialMask]
-
-            if dmat not in material_indices:
-                material_indices[dmat] = len(me.materials)
-                me.materials.append(materials[dmat])
-
-        if prim.type & Primitive.Strip:
-            even = True
-            for i in range(prim.firstElement + 2, prim.firstElement + prim.numElements):
-                if even:
-                    faces.append(((indices[i], indices[i - 1], indices[i - 2]), dmat))
-                else:
-                    faces.append(((indices[i - 2], indices[i - 1], indices[i]), dmat))
-                even = not even
-        elif prim.type & Primitive.Fan:
-            even = True
-            for i in range(prim.firstElement + 2, prim.firstElement + prim.numElements):
-                if even:
-                    faces.append(((indices[i], indices[i - 1], indices[0]), dmat))
-                else:
-                    faces.append(((indices[0], indices[i - 1], indices[i]), dmat))
-                even = not even
-        else: # Default to Triangle Lists (prim.type & Primitive.Triangles)
-            for i in range(prim.firstElement + 2, prim.firstElement + prim.numElements, 3):
-                faces.append(((indices[i], indices[i - 1], indices[i - 2]), dmat))
+    loop_verts = faces.ravel()
 
     me.vertices.add(len(dmesh.verts))
-    me.vertices.foreach_set("co", unpack_list(dmesh.verts))
-    me.vertices.foreach_set("normal", unpack_list(dmesh.normals))
+    me.vertices.foreach_set("co", np.array(dmesh.verts, dtype=np.float32).ravel())
+    me.vertices.foreach_set("normal", np.array(dmesh.normals, dtype=np.float32).ravel())
 
-    me.polygons.add(len(faces))
-    me.loops.add(len(faces) * 3)
-
-    # gyt add: we have to create the bobj here, because we need it to do UV shit in 2.8
-    bobj = bpy.data.objects.new(dedup_name(bpy.data.objects, shape.names[obj.name]), me)
+    me.loops.add(len(loop_verts))
+    me.loops.foreach_set("vertex_index", loop_verts)
 
-    bpy.ops.mesh.uv_texture_add({"object": bobj})
-    uvs = me.uv_layers[0]
+    me.polygons.add(len(faces))
+    me.polygons.foreach_set("loop_start", np.arange(0, len(loop_verts), 3, dtype=np.int32))
+    me.polygons.foreach_set("loop_total", np.full(len(faces), 3, dtype=np.int32))
+    me.polygons.foreach_set("material_index", face_materials)
+    # DTS geometry is always smooth shaded
+    me.polygons.foreach_set("use_smooth", np.ones(len(faces), dtype=bool))
 
-    for i, ((verts, dmat), poly) in enumerate(zip(faces, me.polygons)):
-        poly.use_smooth = True # DTS geometry is always smooth shaded
-        poly.loop_total = 3
-        poly.loop_start = i * 3
+    uvs = me.uv_layers.new()
 
-        if dmat:
-            poly.material_index = material_indices[dmat]
+    if dmesh.tverts:
+        tverts = np.array(dmesh.tverts, dtype=np.float32)[loop_verts]
+        tverts[:, 1] = 1 - tverts[:, 1]
+        uvs.data.foreach_set("uv", tverts.ravel())
 
-        for j, index in zip(poly.loop_indices, verts):
-            me.loops[j].vertex_index = index
-            uv = dmesh.tverts[index]
-            uvs.data[j].uv = (uv.x, 1 - uv.y)
+    bobj = bpy.data.objects.new(dedup_name(bpy.data.objects, shape.names[obj.name]), me)
 
     me.validate()
     me.update()
@@ -182,327 +164,438 @@ def file_base_name(filepath):
     return os.path.basename(filepath).rsplit(".", 1)[0]
 
 def insert_reference(frame, shape_nodes):
+    keyframes = KeyframeBuffer()
+
     for node in shape_nodes:
         ob = node.bl_ob
 
-        curves = ob_location_curves(ob)
-        for curve in curves:
-            curve.keyframe_points.add(1)
-            key = curve.keyframe_points[-1]
-            key.interpolation = "LINEAR"
-            key.co = (frame, ob.location[curve.array_index])
-
-        curves = ob_scale_curves(ob)
-        for curve in curves:
-            curve.keyframe_points.add(1)
-            key = curve.keyframe_points[-1]
-            key.interpolation = "LINEAR"
-            key.co = (frame, ob.scale[curve.array_index])
+        keyframes.add_array(ob_location_curves(ob), (frame,), (ob.location,))
+        keyframes.add_array(ob_scale_curves(ob), (frame,), (ob.scale,))
 
         _, curves = ob_rotation_curves(ob)
-        rot = ob_rotation_data(ob)
-        for curve in curves:
-            curve.keyframe_points.add(1)
-            key = curve.keyframe_points[-1]
-            key.interpolation = "LINEAR"
-            key.co = (frame, rot[curve.array_index])
-
-def load(operator, context, filepath,
-         reference_keyframe=True,
-         import_sequences=True,
-         use_armature=False,
-         debug_report=False):
-    shape = DtsShape()
-
-    with open(filepath, "rb") as fd:
-        shape.load(fd)
+        keyframes.add_array(curves, (frame,), (ob_rotation_data(ob),))
 
-    if debug_report:
-        write_debug_report(filepath + ".txt", shape)
-        with open(filepath + ".pass.dts", "wb") as fd:
-            shape.save(fd)
+    keyframes.flush()
 
-    # Create a Blender material for each DTS material
-    materials = {}
-    color_source = get_rgb_colors()
+def load(operator, context, filepath, **options):
+    return ImportJob(operator, context, filepath, **options).run()
 
-    for dmat in shape.materials:
-        materials[dmat] = import_material(color_source, dmat, filepath)
+def data_collections():
+    return (bpy.data.objects, bpy.data.meshes, bpy.data.materials, bpy.data.images,
+            bpy.data.armatures, bpy.data.actions, bpy.data.collections, bpy.data.texts)
 
-    # Now assign IFL material properties where needed
-    for ifl in shape.iflmaterials:
-        mat = materials[shape.materials[ifl.slot]]
-        assert mat.torque_props.use_ifl == True
-        mat.torque_props.ifl_name = shape.names[ifl.name]
+def existing_data(scene):
+    return set(scene.timeline_markers), [set(ids) for ids in data_collections()]
 
-    # First load all the nodes into armatures
-    lod_by_mesh = {}
+def add_new_data(scene, existing, created):
+    # Adds what appeared since existing was taken to created
+    markers, existing_ids = existing
+    created_markers, created_ids = created
 
-    for lod in shape.detail_levels:
-        lod_by_mesh[lod.objectDetail] = lod
+    created_markers.update(marker for marker in scene.timeline_markers if marker not in markers)
 
-    node_obs = []
-    node_obs_val = {}
+    for ids, old, new in zip(data_collections(), existing_ids, created_ids):
+        new.update(id for id in ids if id not in old)
 
-    if use_armature:
-        root_arm = bpy.data.armatures.new(file_base_name(filepath))
-        root_ob = bpy.data.objects.new(root_arm.name, root_arm)
-        root_ob.show_x_ray = True
+def remove_data(scene, created):
+    created_markers, created_ids = created
 
-        context.collection.objects.link(root_ob)
-        context.collection.objects.active = root_ob
+    for marker in [marker for marker in scene.timeline_markers if marker in created_markers]:
+        scene.timeline_markers.remove(marker)
 
-        # Calculate armature-space matrix, head and tail for each node
-        for i, node in enumerate(shape.nodes):
-            node.mat = shape.default_rotations[i].to_matrix()
-            node.mat = Matrix.Translation(shape.default_translations[i]) * node.mat.to_4x4()
-            if node.parent != -1:
-                node.mat = shape.nodes[node.parent].mat * node.mat
-            # node.head = node.mat.to_translation()
-            # node.tail = node.head + Vector((0, 0, 0.25))
-            # node.tail = node.mat.to_translation()
-            # node.head = node.tail - Vector((0, 0, 0.25))
+    # Only look up what still exists, the user may have deleted some of it
+    bpy.data.batch_remove([id for ids, new in zip(data_collections(), created_ids)
+                           for id in ids if id in new])
 
-        bpy.ops.object.mode_set(mode="EDIT")
+def count_work(shape, import_sequences=True, **options):
+    # The number of steps load_shape yields
+    work = len(shape.materials) + len(shape.nodes) + len(shape.objects)
 
-        edit_bone_table = []
-        bone_names = []
+    if import_sequences:
+        work += len(shape.sequences)
+
+    return work
+
+class ImportJob:
+    # Runs load_shape a few steps at a time with a progress indicator, so a
+    # modal operator can keep the interface responsive and cancel part way
+
+    def __init__(self, operator, context, filepath,
+                 profile=False,
+                 debug_report=False,
+                 shape=None,
+                 **options):
+        self.filepath = filepath
+        self.debug_report = debug_report
+        self.profiler = Profiler() if profile else NullProfiler()
+        self.window_manager = context.window_manager
+        self.scene = context.scene
+
+        # What the import itself created, to be removed if it is cancelled.
+        # Only data that appears while a step runs counts, the user may
+        # create things of their own in between.
+        self.created = (set(), [set() for ids in data_collections()])
+
+        # shape may already have been parsed from filepath, see parallel_import
+        if shape is None:
+            shape = DtsShape()
+
+            try:
+                with self.profiler.phase("parsing"):
+                    with open(filepath, "rb") as fd:
+                        shape.load(fd)
+            except BaseException:
+                self.profiler.close()
+                raise
+
+        self.phase = "parsing"
+        self.done = 0
+        self.total = count_work(shape, **options)
+        self.steps = load_shape(operator, context, filepath, shape, self.profiler,
+                                debug_report=debug_report, **options)
+
+        self.window_manager.progress_begin(0, max(1, self.total))
+
+    def run(self, seconds=None):
+        # Works until the import is done, or for about the given number of
+        # seconds. Returns the operator result or None if there is work left.
+        deadline = None if seconds is None else time.perf_counter() + seconds
+        existing = existing_data(self.scene)
 
-        for i, node in enumerate(shape.nodes):
-            bone = root_arm.edit_bones.new(shape.names[node.name])
-            # bone.use_connect = True
-            # bone.head = node.head
-            # bone.tail = node.tail
-            bone.head = (0, 0, -0.25)
-            bone.tail = (0, 0, 0)
+        try:
+            while True:
+                self.phase, count = next(self.steps)
+                self.done += count
+                self.window_manager.progress_update(self.done)
+
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return None
+        except StopIteration as stop:
+            result = stop.value
+        except BaseException:
+            self.finish()
+            raise
+        finally:
+            add_new_data(self.scene, existing, self.created)
+
+        self.finish()
+        self.profiler.print_summary()
+
+        if self.debug_report and result == {"FINISHED"}:
+            with open(self.filepath + ".txt", "a") as fd:
+                self.profiler.write_summary(fd)
+
+        return result
+
+    def cancel(self):
+        # Stop and remove what has been imported so far
+        self.steps.close()
+        self.finish()
+        remove_data(self.scene, self.created)
+        print("Cancelled importing", self.filepath)
+
+    def finish(self):
+        self.window_manager.progress_end()
+        self.profiler.close()
+
+def load_shape(operator, context, filepath, shape, profiler,
+               reference_keyframe=True,
+               import_sequences=True,
+               use_armature=False,
+               debug_report=False):
+    # Yields (phase, steps done) after each piece of work and returns the
+    # operator result. The context may not stay valid between steps.
+    scene = context.scene
+    collection = context.collection
 
-            if node.parent != -1:
-                bone.parent = edit_bone_table[node.parent]
+    if debug_report:
+        write_debug_report(filepath + ".txt", shape)
+        with open(filepath + ".pass.dts", "wb") as fd:
+            shape.save(fd)
 
-            bone.matrix = node.mat
-            bone["nodeIndex"] = i
+    # Texture directories may have changed since the last import
+    texture_index.new_generation()
 
-            edit_bone_table.append(bone)
-            bone_names.append(bone.name)
+    # Create a Blender material for each DTS material
+    materials = {}
+    color_source = get_rgb_colors()
 
-        bpy.ops.object.mode_set(mode="OBJECT")
-    else:
-        if reference_keyframe:
-            reference_marker = context.scene.timeline_markers.get("reference")
-            if reference_marker is None:
-                reference_frame = 0
-                context.scene.timeline_markers.new("reference", frame=reference_frame)
-            else:
-                reference_frame = reference_marker.frame
+    # Phases are only open while working, not while waiting between steps
+    for dmat in shape.materials:
+        with profiler.phase("material import"):
+            materials[dmat] = import_material(color_source, dmat, filepath)
+
+        yield "materials", 1
+
+    with profiler.phase("material import"):
+        # Now assign IFL material properties where needed
+        for ifl in shape.iflmaterials:
+            mat = materials[shape.materials[ifl.slot]]
+            assert mat.torque_props.use_ifl == True
+            mat.torque_props.ifl_name = shape.names[ifl.name]
+
+    with profiler.phase("node creation"):
+        # First load all the nodes into armatures
+        lod_by_mesh = {}
+
+        for lod in shape.detail_levels:
+            lod_by_mesh[lod.objectDetail] = lod
+
+        node_obs = []
+        node_obs_val = {}
+
+        if use_armature:
+            root_arm = bpy.data.armatures.new(file_base_name(filepath))
+            root_ob = bpy.data.objects.new(root_arm.name, root_arm)
+            root_ob.show_x_ray = True
+
+            collection.objects.link(root_ob)
+            collection.objects.active = root_ob
+
+            # Calculate armature-space matrix, head and tail for each node
+            for i, node in enumerate(shape.nodes):
+                node.mat = shape.default_rotations[i].to_matrix()
+                node.mat = Matrix.Translation(shape.default_translations[i]) * node.mat.to_4x4()
+                if node.parent != -1:
+                    node.mat = shape.nodes[node.parent].mat * node.mat
+                # node.head = node.mat.to_translation()
+                # node.tail = node.head + Vector((0, 0, 0.25))
+                # node.tail = node.mat.to_translation()
+                # node.head = node.tail - Vector((0, 0, 0.25))
+
+            bpy.ops.object.mode_set(mode="EDIT")
+
+            edit_bone_table = []
+            bone_names = []
+
+            for i, node in enumerate(shape.nodes):
+                bone = root_arm.edit_bones.new(shape.names[node.name])
+                # bone.use_connect = True
+                # bone.head = node.head
+                # bone.tail = node.tail
+                bone.head = (0, 0, -0.25)
+                bone.tail = (0, 0, 0)
+
+                if node.parent != -1:
+                    bone.parent = edit_bone_table[node.parent]
+
+                bone.matrix = node.mat
+                bone["nodeIndex"] = i
+
+                edit_bone_table.append(bone)
+                bone_names.append(bone.name)
+
+            bpy.ops.object.mode_set(mode="OBJECT")
         else:
-            reference_frame = None
+            if reference_keyframe:
+                reference_marker = scene.timeline_markers.get("reference")
+                if reference_marker is None:
+                    reference_frame = 0
+                    scene.timeline_markers.new("reference", frame=reference_frame)
+                else:
+                    reference_frame = reference_marker.frame
+            else:
+                reference_frame = None
 
+    if use_armature:
+        yield "nodes", len(shape.nodes)
+    else:
         # Create an empty for every node
         for i, node in enumerate(shape.nodes):
-            ob = bpy.data.objects.new(dedup_name(bpy.data.objects, shape.names[node.name]), None)
-            node.bl_ob = ob
-            ob["nodeIndex"] = i
-            ob.empty_display_type = "SINGLE_ARROW"
-            ob.empty_display_size = 0.5
+            with profiler.phase("node creation"):
+                ob = bpy.data.objects.new(dedup_name(bpy.data.objects, shape.names[node.name]), None)
+                node.bl_ob = ob
+                ob["nodeIndex"] = i
+                ob.empty_display_type = "SINGLE_ARROW"
+                ob.empty_display_size = 0.5
 
-            if node.parent != -1:
-                ob.parent = node_obs[node.parent]
+                if node.parent != -1:
+                    ob.parent = node_obs[node.parent]
 
-            ob.location = shape.default_translations[i]
-            ob.rotation_mode = "QUATERNION"
-            ob.rotation_quaternion = shape.default_rotations[i]
-            if shape.names[node.name] == "__auto_root__" and ob.rotation_quaternion.magnitude == 0:
-                ob.rotation_quaternion = (1, 0, 0, 0)
+                ob.location = shape.default_translations[i]
+                ob.rotation_mode = "QUATERNION"
+                ob.rotation_quaternion = shape.default_rotations[i]
+                if shape.names[node.name] == "__auto_root__" and ob.rotation_quaternion.magnitude == 0:
+                    ob.rotation_quaternion = (1, 0, 0, 0)
 
-            context.collection.objects.link(ob)
-            node_obs.append(ob)
-            node_obs_val[node] = ob
+                collection.objects.link(ob)
+                node_obs.append(ob)
+                node_obs_val[node] = ob
 
-        if reference_keyframe:
-            insert_reference(reference_frame, shape.nodes)
+            yield "nodes", 1
+
+        with profiler.phase("node creation"):
+            if reference_keyframe:
+                insert_reference(reference_frame, shape.nodes)
 
     # Try animation?
     if import_sequences:
-        globalToolIndex = 10
-        fps = context.scene.render.fps
+        with profiler.phase("sequence import"):
+            globalToolIndex = 10
+            fps = scene.render.fps
+            keyframes = KeyframeBuffer()
 
-        sequences_text = []
+            sequences_text = []
 
         for seq in shape.sequences:
-            name = shape.names[seq.nameIndex]
-            print("Importing sequence", name)
+            with profiler.phase("sequence import"):
+                name = shape.names[seq.nameIndex]
+                print("Importing sequence", name)
+
+                flags = []
+                flags.append("priority {}".format(seq.priority))
 
-            flags = []
-            flags.append("priority {}".format(seq.priority))
+                if seq.flags & Sequence.Cyclic:
+                    flags.append("cyclic")
 
-            if seq.flags & Sequence.Cyclic:
-                flags.append("cyclic")
+                if seq.flags & Sequence.Blend:
+                    flags.append("blend")
 
-            if seq.flags & Sequence.Blend:
-                flags.append("blend")
+                flags.append("duration {}".format(seq.duration))
 
-            flags.append("duration {}".format(seq.duration))
+                if flags:
+                    sequences_text.append(name + ": " + ", ".join(flags))
 
-            if flags:
-                sequences_text.append(name + ": " + ", ".join(flags))
+                nodesRotation = tuple(map(lambda p: p[0], filter(lambda p: p[1], zip(shape.nodes, seq.rotationMatters))))
+                nodesTranslation = tuple(map(lambda p: p[0], filter(lambda p: p[1], zip(shape.nodes, seq.translationMatters))))
+                nodesScale = tuple(map(lambda p: p[0], filter(lambda p: p[1], zip(shape.nodes, seq.scaleMatters))))
+                nodesVis = tuple(map(lambda p: p[0], filter(lambda p: p[1], zip(shape.nodes, seq.visMatters))))
 
-            nodesRotation = tuple(map(lambda p: p[0], filter(lambda p: p[1], zip(shape.nodes, seq.rotationMatters))))
-            nodesTranslation = tuple(map(lambda p: p[0], filter(lambda p: p[1], zip(shape.nodes, seq.translationMatters))))
-            nodesScale = tuple(map(lambda p: p[0], filter(lambda p: p[1], zip(shape.nodes, seq.scaleMatters))))
-            nodesVis = tuple(map(lambda p: p[0], filter(lambda p: p[1], zip(shape.nodes, seq.visMatters))))
+                step = 1
+                frames = [globalToolIndex + frameIndex * step for frameIndex in range(seq.numKeyframes)]
 
-            step = 1
+                if seq.flags & Sequence.Blend and reference_frame is None and \
+                        (nodesTranslation or nodesRotation):
+                    keyframes.flush()
+                    return fail(operator, "Missing 'reference' marker for blend animation '{}'".format(name))
 
-            for mattersIndex, node in enumerate(nodesTranslation):
-                ob = node_obs_val[node]
-                curves = ob_location_curves(ob)
+                for mattersIndex, node in enumerate(nodesTranslation):
+                    ob = node_obs_val[node]
+                    curves = ob_location_curves(ob)
+                    base = seq.baseTranslation + mattersIndex * seq.numKeyframes
+                    vecs = shape.node_translations[base:base + seq.numKeyframes]
 
-                for frameIndex in range(seq.numKeyframes):
-                    vec = shape.node_translations[seq.baseTranslation + mattersIndex * seq.numKeyframes + frameIndex]
                     if seq.flags & Sequence.Blend:
-                        if reference_frame is None:
-                            return fail(operator, "Missing 'reference' marker for blend animation '{}'".format(name))
                         ref_vec = Vector(evaluate_all(curves, reference_frame))
-                        vec = ref_vec + vec
+                        vecs = [ref_vec + vec for vec in vecs]
+
+                    keyframes.add_array(curves, frames, vecs)
+
+                for mattersIndex, node in enumerate(nodesRotation):
+                    ob = node_obs_val[node]
+                    mode, curves = ob_rotation_curves(ob)
+                    base = seq.baseRotation + mattersIndex * seq.numKeyframes
+                    rots = shape.node_rotations[base:base + seq.numKeyframes]
 
-                    for curve in curves:
-                        curve.keyframe_points.add(1)
-                        key = curve.keyframe_points[-1]
-                        key.interpolation = "LINEAR"
-                        key.co = (
-                            globalToolIndex + frameIndex * step,
-                            vec[curve.array_index])
-
-            for mattersIndex, node in enumerate(nodesRotation):
-                ob = node_obs_val[node]
-                mode, curves = ob_rotation_curves(ob)
-
-                for frameIndex in range(seq.numKeyframes):
-                    rot = shape.node_rotations[seq.baseRotation + mattersIndex * seq.numKeyframes + frameIndex]
                     if seq.flags & Sequence.Blend:
-                        if reference_frame is None:
-                            return fail(operator, "Missing 'reference' marker for blend animation '{}'".format(name))
                         ref_rot = Quaternion(evaluate_all(curves, reference_frame))
-                        rot = ref_rot @ rot
+                        rots = [ref_rot @ rot for rot in rots]
+
                     if mode == 'AXIS_ANGLE':
-                        rot = rot.to_axis_angle()
+                        rots = [rot.to_axis_angle() for rot in rots]
                     elif mode != 'QUATERNION':
-                        rot = rot.to_euler(mode)
+                        rots = [rot.to_euler(mode) for rot in rots]
 
-                    for curve in curves:
-                        curve.keyframe_points.add(1)
-                        key = curve.keyframe_points[-1]
-                        key.interpolation = "LINEAR"
-                        key.co = (
-                            globalToolIndex + frameIndex * step,
-                            rot[curve.array_index])
+                    keyframes.add_array(curves, frames, rots)
 
-            for mattersIndex, node in enumerate(nodesScale):
-                ob = node_obs_val[node]
-                curves = ob_scale_curves(ob)
-
-                for frameIndex in range(seq.numKeyframes):
-                    index = seq.baseScale + mattersIndex * seq.numKeyframes + frameIndex
+                for mattersIndex, node in enumerate(nodesScale):
+                    ob = node_obs_val[node]
+                    curves = ob_scale_curves(ob)
+                    base = seq.baseScale + mattersIndex * seq.numKeyframes
 
                     if seq.flags & Sequence.UniformScale:
-                        s = shape.node_uniform_scales[index]
-                        vec = (s, s, s)
+                        vecs = [(s, s, s) for s in shape.node_uniform_scales[base:base + seq.numKeyframes]]
                     elif seq.flags & Sequence.AlignedScale:
-                        vec = shape.node_aligned_scales[index]
+                        vecs = shape.node_aligned_scales[base:base + seq.numKeyframes]
                     elif seq.flags & Sequence.ArbitraryScale:
                         print("Warning: Arbitrary scale animation not implemented")
-                        break
+                        continue
                     else:
                         print("Warning: Invalid scale flags found in sequence")
-                        break
+                        continue
 
-                    for curve in curves:
-                        curve.keyframe_points.add(1)
-                        key = curve.keyframe_points[-1]
-                        key.interpolation = "LINEAR"
-                        key.co = (
-                            globalToolIndex + frameIndex * step,
-                            vec[curve.array_index])
+                    keyframes.add_array(curves, frames, vecs)
 
-            for mattersIndex, node in enumerate(nodesVis):
-                ob = node_obs_val[node]
-                curves = ob_vis_curves(ob)
+                for mattersIndex, node in enumerate(nodesVis):
+                    ob = node_obs_val[node]
+                    curves = ob_vis_curves(ob)
 
-                # if not hasattr(ob, 'vis'):
-                #    ob['vis'] = shape.objectstates[seq.baseObjectState].vis
+                    # if not hasattr(ob, 'vis'):
+                    #    ob['vis'] = shape.objectstates[seq.baseObjectState].vis
 
-                ob.torque_vis_props.vis_value = shape.objectstates[seq.baseObjectState].vis
+                    ob.torque_vis_props.vis_value = shape.objectstates[seq.baseObjectState].vis
 
-                for frameIndex in range(seq.numKeyframes):
-                    vis = shape.objectstates[seq.baseObjectState + mattersIndex * seq.numKeyframes + frameIndex].vis
+                    base = seq.baseObjectState + mattersIndex * seq.numKeyframes
+                    vis = [state.vis for state in shape.objectstates[base:base + seq.numKeyframes]]
 
                     for curve in curves:
-                        curve.keyframe_points.add(1)
-                        key = curve.keyframe_points[-1]
-                        key.interpolation = "LINEAR"
-                        key.co = (
-                            globalToolIndex + frameIndex * step,
-                            vis)
+                        keyframes.add(curve, frames, vis)
 
-                        print(vis)
+                # Insert a reference frame immediately before the animation
+                # insert_reference(globalToolIndex - 2, shape.nodes)
 
-            # Insert a reference frame immediately before the animation
-            # insert_reference(globalToolIndex - 2, shape.nodes)
+                scene.timeline_markers.new(name + ":start", frame=globalToolIndex)
+                scene.timeline_markers.new(name + ":end", frame=(globalToolIndex + seq.numKeyframes * step - 1))
+                globalToolIndex += seq.numKeyframes * step + 30
 
-            context.scene.timeline_markers.new(name + ":start", frame=globalToolIndex)
-            context.scene.timeline_markers.new(name + ":end", frame=(globalToolIndex + seq.numKeyframes * step - 1))
-            globalToolIndex += seq.numKeyframes * step + 30
+            yield "sequences", 1
 
-        if "Sequences" in bpy.data.texts:
-            sequences_buf = bpy.data.texts["Sequences"]
-        else:
-            sequences_buf = bpy.data.texts.new("Sequences")
+        with profiler.phase("sequence import"):
+            keyframes.flush()
+
+            if "Sequences" in bpy.data.texts:
+                sequences_buf = bpy.data.texts["Sequences"]
+            else:
+                sequences_buf = bpy.data.texts.new("Sequences")
 
-        sequences_buf.from_string("\n".join(sequences_text))
+            sequences_buf.from_string("\n".join(sequences_text))
 
     # Then put objects in the armatures
     for obj in shape.objects:
-        if obj.node == -1:
-            print('Warning: Object {} is not attached to a node, ignoring'
-                  .format(shape.names[obj.name]))
-            continue
-
-        for meshIndex in range(obj.numMeshes):
-            mesh = shape.meshes[obj.firstMesh + meshIndex]
-            mtype = mesh.type
+        yield "meshes", 1
 
-            if mtype == Mesh.NullType:
+        with profiler.phase("mesh creation"):
+            if obj.node == -1:
+                print('Warning: Object {} is not attached to a node, ignoring'
+                      .format(shape.names[obj.name]))
                 continue
 
-            if mtype != Mesh.StandardType and mtype != Mesh.SkinType:
-                print('Warning: Mesh #{} of object {} is of unsupported type {}, ignoring'.format(
-                    meshIndex + 1, mtype, shape.names[obj.name]))
-                continue
+            for meshIndex in range(obj.numMeshes):
+                mesh = shape.meshes[obj.firstMesh + meshIndex]
+                mtype = mesh.type
 
-            bobj = create_bobj(context, mesh, materials, shape, obj)
-            context.collection.objects.link(bobj)
+                if mtype == Mesh.NullType:
+                    continue
 
-            add_vertex_groups(mesh, bobj, shape)
+                if mtype != Mesh.StandardType and mtype != Mesh.SkinType:
+                    print('Warning: Mesh #{} of object {} is of unsupported type {}, ignoring'.format(
+                        meshIndex + 1, mtype, shape.names[obj.name]))
+                    continue
 
-            if obj.node != -1:
-                if use_armature:
-                    bobj.parent = root_ob
-                    bobj.parent_bone = bone_names[obj.node]
-                    bobj.parent_type = "BONE"
-                    bobj.matrix_world = shape.nodes[obj.node].mat
+                bobj = create_bobj(context, mesh, materials, shape, obj)
+                collection.objects.link(bobj)
 
-                    if mtype == Mesh.SkinType:
-                        modifier = bobj.modifiers.new('Armature', 'ARMATURE')
-                        modifier.object = root_ob
-                else:
-                    bobj.parent = node_obs[obj.node]
+                add_vertex_groups(mesh, bobj, shape)
+
+                if obj.node != -1:
+                    if use_armature:
+                        bobj.parent = root_ob
+                        bobj.parent_bone = bone_names[obj.node]
+                        bobj.parent_type = "BONE"
+                        bobj.matrix_world = shape.nodes[obj.node].mat
+
+                        if mtype == Mesh.SkinType:
+                            modifier = bobj.modifiers.new('Armature', 'ARMATURE')
+                            modifier.object = root_ob
+                    else:
+                        bobj.parent = node_obs[obj.node]
 
-            lod_name = shape.names[lod_by_mesh[meshIndex].name]
+                lod_name = shape.names[lod_by_mesh[meshIndex].name]
 
-            if lod_name not in bpy.data.collections:
-                bpy.data.collections.new(lod_name)
+                if lod_name not in bpy.data.collections:
+                    bpy.data.collections.new(lod_name)
 
-            bpy.data.collections[lod_name].objects.link(bobj)
+                bpy.data.collections[lod_name].objects.link(bobj)
 
     # Import a bounds mesh
     me = bpy.data.meshes.new("Mesh")
@@ -519,7 +612,7 @@ def load(operator, context, filepath,
     me.update()
     ob = bpy.data.objects.new("bounds", me)
     ob.display_type = "BOUNDS"
-    context.collection.objects.link(ob)
+    collection.objects.link(ob)
 
     return {"FINISHED"}
 
@@ -529,5 +622,13 @@ def add_vertex_groups(mesh, ob, shape):
         if node != -1:
             ob.vertex_groups.new(name=shape.names[shape.nodes[node].name])
 
+    # One add() call per group and weight instead of one per influence
+    vertices = defaultdict(list)
+
     for vertex, bone, weight in mesh.influences:
-        ob.vertex_groups[bone].add((vertex,), weight, 'REPLACE')
+        vertices[bone, weight].append(vertex)
+
+    groups = ob.vertex_groups
+
+    for (bone, weight), indices in vertices.items():
+        groups[bone].add(indices, weight, 'REPLACE')
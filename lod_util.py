@@ -0,0 +1,82 @@
+from mathutils.bvhtree import BVHTree
+
+from .DtsTypes import Mesh
+
+def parse_number_list(text, type=float):
+    # "16, 8 4" -> [16, 8, 4]
+    return [type(part) for part in text.replace(",", " ").split()]
+
+def mesh_triangles(dmesh):
+    # Exported meshes are indexed triangle lists
+    indices = dmesh.indices
+    return [tuple(indices[i:i + 3]) for i in range(0, len(indices) - 2, 3)]
+
+def triangle_count(dmesh):
+    if dmesh.type == Mesh.NullType:
+        return 0
+
+    return len(dmesh.indices) // 3
+
+def surface_samples(dmesh):
+    # The vertices plus the center of every triangle
+    samples = list(dmesh.verts)
+
+    for a, b, c in mesh_triangles(dmesh):
+        samples.append((dmesh.verts[a] + dmesh.verts[b] + dmesh.verts[c]) / 3)
+
+    return samples
+
+def mesh_extent(dmesh):
+    # Half the diagonal of the bounding box
+    if not dmesh.verts:
+        return 0.0
+
+    low = [min(vert[i] for vert in dmesh.verts) for i in range(3)]
+    high = [max(vert[i] for vert in dmesh.verts) for i in range(3)]
+    return sum((h - l) ** 2 for l, h in zip(low, high)) ** 0.5 / 2
+
+def one_sided_distances(samples, tree):
+    distances = []
+
+    for vert in samples:
+        location, normal, index, distance = tree.find_nearest(vert)
+
+        if distance is not None:
+            distances.append(distance)
+
+    return distances
+
+def mesh_distance_error(source, target):
+    # Approximate symmetric (Hausdorff) distance between two meshes, measured
+    # from points sampled on each mesh to the surface of the other one.
+    # Returns (average, maximum).
+    source_tree = BVHTree.FromPolygons(source.verts, mesh_triangles(source))
+    target_tree = BVHTree.FromPolygons(target.verts, mesh_triangles(target))
+
+    distances = one_sided_distances(surface_samples(target), source_tree)
+    distances += one_sided_distances(surface_samples(source), target_tree)
+
+    if not distances:
+        return 0.0, 0.0
+
+    return sum(distances) / len(distances), max(distances)
+
+def screen_error_sizes(sizes, errors, radius, pixel_error):
+    # errors[i] is how far detail level i deviates from detail level 0.
+    # A shape whose radius covers p pixels shows an error e as e * p / radius
+    # pixels, so detail level i may switch to i + 1 as soon as the shape
+    # is smaller than pixel_error * radius / errors[i + 1] pixels.
+    # Levels without a measurable error keep their size, and the result
+    # never increases so the order of the levels is kept.
+    result = []
+
+    for i, size in enumerate(sizes):
+        if i + 1 < len(sizes) and errors[i + 1] > 0:
+            size = pixel_error * radius / errors[i + 1]
+
+        if result:
+            size = min(size, result[-1])
+
+        result.append(size)
+
+    return result
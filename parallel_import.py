@@ -0,0 +1,128 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.reduction import ForkingPickler
+
+# Files are parsed by plain Python processes, which need the standalone
+# mathutils package, the one built into Blender isn't there. Without it
+# the files are parsed here instead.
+try:
+    from mathutils import Vector, Quaternion, Matrix
+except ImportError:
+    Vector = Quaternion = Matrix = None
+
+# Parsed files travel back from the workers through multiprocessing, which
+# can't pickle mathutils types on its own. They are rebuilt through these
+# functions because the types don't name their module.
+
+def make_vector(values):
+    return Vector(values)
+
+def make_quaternion(values):
+    return Quaternion(values)
+
+def make_matrix(rows):
+    return Matrix(rows)
+
+def reduce_vector(v):
+    return make_vector, (tuple(v),)
+
+def reduce_quaternion(q):
+    return make_quaternion, (tuple(q),)
+
+def reduce_matrix(m):
+    return make_matrix, (tuple(tuple(row) for row in m),)
+
+if Vector is not None:
+    ForkingPickler.register(Vector, reduce_vector)
+    ForkingPickler.register(Quaternion, reduce_quaternion)
+    ForkingPickler.register(Matrix, reduce_matrix)
+
+def parse_file(format, filepath):
+    from .DtsShape import DtsShape
+    from .DsqFile import DsqFile
+
+    if format == "dts":
+        parsed = DtsShape()
+
+        with open(filepath, "rb") as fd:
+            parsed.load(fd)
+    else:
+        parsed = DsqFile()
+
+        with open(filepath, "rb") as fd:
+            parsed.read(fd)
+
+    return parsed
+
+def parse_job(job):
+    # Runs in a worker process
+    format, filepath = job
+
+    try:
+        return parse_file(format, filepath), None
+    except Exception as e:
+        return None, "{}: {}".format(type(e).__name__, e)
+
+def parse_files(format, filepaths, workers):
+    # Parses the files in a process pool. Yields (filepath, parsed, error) in
+    # the order of filepaths, each one as soon as it and the ones before it
+    # are done, while the rest keep parsing.
+    done = 0
+
+    # Forking Blender isn't safe, start fresh interpreters instead
+    context = multiprocessing.get_context("spawn")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            results = executor.map(parse_job, [(format, filepath) for filepath in filepaths])
+
+            for filepath, (parsed, error) in zip(filepaths, results):
+                # A worker may lack mathutils, the error worth reporting is
+                # the one from parsing here
+                if parsed is None:
+                    parsed, error = parse_job((format, filepath))
+
+                done += 1
+                yield filepath, parsed, error
+    except (BrokenProcessPool, OSError) as e:
+        print("Warning: Could not parse in parallel ({}), parsing one file at a time".format(e))
+
+    for filepath in filepaths[done:]:
+        parsed, error = parse_job((format, filepath))
+        yield filepath, parsed, error
+
+def load(operator, context, format, filepaths, **options):
+    # Import several DTS or DSQ files. Parsing doesn't touch bpy and runs in
+    # parallel, the scene is built from the results one file at a time.
+    from . import import_dts, import_dsq
+
+    if format == "dts":
+        loader, keyword = import_dts.load, "shape"
+    else:
+        loader, keyword = import_dsq.load, "dsq"
+
+    workers = min(len(filepaths), os.cpu_count() or 1)
+    failed = []
+
+    for filepath, parsed, error in parse_files(format, filepaths, workers):
+        if parsed is None:
+            print("Warning: Could not read '{}': {}".format(filepath, error))
+            failed.append(filepath)
+            continue
+
+        print("Importing {}".format(filepath))
+        options[keyword] = parsed
+
+        if loader(operator, context, filepath, **options) != {"FINISHED"}:
+            failed.append(filepath)
+
+    if len(failed) == len(filepaths):
+        return {"CANCELLED"}
+
+    if failed:
+        operator.report({"WARNING"}, "{} of {} files could not be imported, see the console".format(
+            len(failed), len(filepaths)))
+
+    return {"FINISHED"}
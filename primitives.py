@@ -0,0 +1,72 @@
+import numpy as np
+
+from .DtsTypes import Primitive
+
+def alternate(a, b, c):
+    # Strips flip their winding on every other triangle
+    faces = np.stack((c, b, a), axis=1)
+    faces[1::2] = np.stack((a, b, c), axis=1)[1::2]
+    return faces
+
+def primitive_faces(prim, indices):
+    # Decode one primitive into an (N, 3) array of vertex indices
+    first = prim.firstElement
+    elements = indices[first:first + prim.numElements]
+
+    if len(elements) < 3:
+        return np.zeros((0, 3), dtype=np.int32)
+
+    if prim.type & Primitive.Strip:
+        return alternate(elements[:-2], elements[1:-1], elements[2:])
+    elif prim.type & Primitive.Fan:
+        # Every triangle of a fan shares the primitive's first element and
+        # keeps the winding of the first one
+        center = np.full(len(elements) - 2, elements[0], dtype=elements.dtype)
+        return np.stack((elements[2:], elements[1:-1], center), axis=1)
+    else: # Default to Triangle Lists (prim.type & Primitive.Triangles)
+        count = len(elements) // 3
+        return elements[:count * 3].reshape(-1, 3)[:, ::-1]
+
+def decode_primitives(primitives, indices, drop_degenerate=True):
+    # Turn the primitives of a mesh into triangles.
+    # Returns an (F, 3) int32 array of vertex indices and an (F,) array of
+    # DTS material indices, which is -1 for primitives without a material.
+    indexed = np.asarray(indices, dtype=np.int32)
+    elements = None
+
+    face_arrays = []
+    material_arrays = []
+
+    for prim in primitives:
+        if prim.type & Primitive.Indexed:
+            source = indexed
+        else:
+            if elements is None:
+                elements = np.arange(max(p.firstElement + p.numElements for p in primitives),
+                                     dtype=np.int32)
+            source = elements
+
+        if prim.type & Primitive.NoMaterial:
+            material = -1
+        else:
+            material = prim.type & Primitive.MaterialMask
+
+        faces = primitive_faces(prim, source)
+        face_arrays.append(faces)
+        material_arrays.append(np.full(len(faces), material, dtype=np.int32))
+
+    if not face_arrays:
+        return np.zeros((0, 3), dtype=np.int32), np.zeros(0, dtype=np.int32)
+
+    faces = np.ascontiguousarray(np.concatenate(face_arrays), dtype=np.int32)
+    materials = np.concatenate(material_arrays)
+
+    if drop_degenerate:
+        # Strips are stitched together with zero area triangles
+        keep = ((faces[:, 0] != faces[:, 1]) &
+                (faces[:, 1] != faces[:, 2]) &
+                (faces[:, 0] != faces[:, 2]))
+        faces = faces[keep]
+        materials = materials[keep]
+
+    return faces, materials
@@ -0,0 +1,103 @@
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+class Phase:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak = 0
+
+class Profiler:
+    # Collects wall time, CPU time and peak traced memory for named phases.
+    # Phases may nest and may be entered many times, their numbers add up.
+
+    def __init__(self):
+        self.phases = {}
+        self.stack = []
+
+        # tracemalloc.reset_peak needs Python 3.9. Without it peaks are
+        # measured from the start of profiling and only approximate.
+        self.can_reset_peak = hasattr(tracemalloc, "reset_peak")
+        self.started_tracing = not tracemalloc.is_tracing()
+
+        if self.started_tracing:
+            tracemalloc.start()
+
+    @contextmanager
+    def phase(self, name):
+        phase = self.phases.get(name)
+
+        if phase is None:
+            phase = self.phases[name] = Phase(name)
+
+        base, peak = tracemalloc.get_traced_memory()
+
+        if self.stack:
+            self.stack[-1][1] = max(self.stack[-1][1], peak)
+
+        if self.can_reset_peak:
+            tracemalloc.reset_peak()
+
+        frame = [base, 0]
+        self.stack.append(frame)
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+
+        try:
+            yield
+        finally:
+            phase.calls += 1
+            phase.wall += time.perf_counter() - wall
+            phase.cpu += time.process_time() - cpu
+
+            self.stack.pop()
+            peak = max(tracemalloc.get_traced_memory()[1], frame[1])
+            phase.peak = max(phase.peak, peak - base)
+
+            # Let the enclosing phase see the peak this one reset
+            if self.stack:
+                self.stack[-1][1] = max(self.stack[-1][1], peak)
+
+    def summary(self):
+        lines = ["{:<24} {:>6} {:>10} {:>10} {:>12}".format(
+            "Phase", "Calls", "Wall ms", "CPU ms", "Peak KiB")]
+
+        for phase in self.phases.values():
+            lines.append("{:<24} {:>6} {:>10.1f} {:>10.1f} {:>12.1f}".format(
+                phase.name, phase.calls, phase.wall * 1000, phase.cpu * 1000, phase.peak / 1024))
+
+        return lines
+
+    def print_summary(self):
+        print("\n".join(self.summary()))
+
+    def write_summary(self, fd):
+        fd.write("Profile:\n")
+
+        for line in self.summary():
+            fd.write("  " + line + "\n")
+
+    def close(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+class NullProfiler:
+    # Used when profiling is off so call sites don't need to check
+
+    @contextmanager
+    def phase(self, name):
+        yield
+
+    def print_summary(self):
+        pass
+
+    def write_summary(self, fd):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from .DtsShape import load_materials
+from .DtsTypes import Material
+from .textures import texture_index
+
+# Lists the textures the .dts files in a directory tree need and which of
+# them can't be found, using the same lookup as the importer.
+
+def find_shapes(root):
+    shapes = []
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.lower().endswith(".dts"):
+                shapes.append(os.path.join(dirpath, filename))
+
+    # Shapes in the same directory end up in the same chunk of work and
+    # share their texture directory listings
+    shapes.sort()
+    return shapes
+
+def scan_shape(filepath):
+    # Runs in a worker process
+    try:
+        with open(filepath, "rb") as fd:
+            materials = load_materials(fd)
+    except Exception as e:
+        return {"shape": filepath, "error": "{}: {}".format(type(e).__name__, e)}
+
+    textures = {}
+
+    for mat in materials:
+        # IFL materials name a frame list, not a texture
+        if mat.flags & Material.IFLMaterial:
+            continue
+
+        textures[mat.name] = texture_index.resolve(filepath, mat.name)
+
+    return {"shape": filepath, "textures": textures}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Find the textures used by DTS files that can't be found")
+    parser.add_argument("root", help="Directory to search for .dts files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Number of processes reading shapes at once")
+    parser.add_argument("--json", action="store_true",
+                        help="Print every shape with its resolved textures as JSON")
+    args = parser.parse_args(argv)
+
+    shapes = find_shapes(args.root)
+    chunksize = max(1, len(shapes) // (args.workers * 8))
+    results = []
+    missing = 0
+    failed = 0
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for result in executor.map(scan_shape, shapes, chunksize=chunksize):
+            results.append(result)
+
+            if "error" in result:
+                failed += 1
+                print("Error: Could not read {}: {}".format(result["shape"], result["error"]),
+                      file=sys.stderr)
+                continue
+
+            for name, path in result["textures"].items():
+                if path is None:
+                    missing += 1
+
+                    if not args.json:
+                        print("{}: missing texture '{}'".format(result["shape"], name))
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    print("{} shapes, {} missing textures, {} unreadable".format(len(shapes), missing, failed),
+          file=sys.stderr)
+
+    return 1 if missing or failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+import struct
+from math import atan2
+
+import numpy as np
+
+from .DtsTypes import Sequence, ObjectState, Vector, Quaternion
+
+# Size in bytes of a single key for each kind of node transform
+key_size_rotation = 8
+key_size_translation = 12
+key_size_uniform_scale = 4
+key_size_aligned_scale = 12
+
+scale_flags = Sequence.UniformScale | Sequence.AlignedScale | Sequence.ArbitraryScale
+
+class SequenceKeys:
+    def __init__(self, frames):
+        # The (possibly fractional) source frame of every key
+        self.frames = list(frames)
+
+        # Per-node key lists, indexed by node index.
+        # Only nodes with their matters bit set should have an entry.
+        self.rotations = {}
+        self.translations = {}
+        self.scales = {}
+        self.vis = {}
+
+    def key_bytes(self, seq):
+        if seq.flags & Sequence.UniformScale:
+            scale_size = key_size_uniform_scale
+        else:
+            scale_size = key_size_aligned_scale
+
+        return len(self.frames) * (
+            len(self.rotations) * key_size_rotation +
+            len(self.translations) * key_size_translation +
+            len(self.scales) * scale_size)
+
+def vec_close(a, b, tolerance):
+    return all(abs(i - j) <= tolerance for i, j in zip(a, b))
+
+def quat_close(a, b, tolerance):
+    # q and -q describe the same rotation
+    return vec_close(a, b, tolerance) or vec_close(a, -b, tolerance)
+
+def is_uniform_scale(scale, tolerance):
+    return abs(scale.x - scale.y) <= tolerance and abs(scale.x - scale.z) <= tolerance
+
+def prune_constant_channels(seq, keys, default_translations, default_rotations, tolerance):
+    # Nodes that do not matter are left in their default pose by the engine,
+    # so a channel can only be dropped if it never leaves that pose.
+    # Blend sequences store deltas from the default pose instead.
+    pruned = 0
+    bytes_before = keys.key_bytes(seq)
+
+    for index, values in tuple(keys.translations.items()):
+        rest = Vector() if seq.flags & Sequence.Blend else default_translations[index]
+
+        if all(vec_close(value, rest, tolerance) for value in values):
+            del keys.translations[index]
+            seq.translationMatters[index] = False
+            pruned += 1
+
+    for index, values in tuple(keys.rotations.items()):
+        rest = Quaternion() if seq.flags & Sequence.Blend else default_rotations[index]
+
+        if all(quat_close(value, rest, tolerance) for value in values):
+            del keys.rotations[index]
+            seq.rotationMatters[index] = False
+            pruned += 1
+
+    one = Vector((1.0, 1.0, 1.0))
+
+    for index, values in tuple(keys.scales.items()):
+        if all(vec_close(value, one, tolerance) for value in values):
+            del keys.scales[index]
+            seq.scaleMatters[index] = False
+            pruned += 1
+
+    # Use the cheapest scale representation that still fits the data
+    seq.flags &= ~scale_flags
+
+    if keys.scales:
+        if all(is_uniform_scale(value, tolerance)
+               for values in keys.scales.values() for value in values):
+            seq.flags |= Sequence.UniformScale
+        else:
+            seq.flags |= Sequence.AlignedScale
+
+    return pruned, bytes_before - keys.key_bytes(seq)
+
+class KeyBlockCache:
+    # Remembers the key blocks written so far, so a sequence whose block
+    # of a kind is identical to an earlier one (same nodes, same key count
+    # and the same data as stored in the file) can point at that one.
+
+    def __init__(self):
+        self.blocks = {}
+        self.reused_keys = 0
+
+    def add(self, kind, table, indices, count, values, encode):
+        # Returns the base offset of the block of values in table
+        if not values:
+            return len(table)
+
+        data = b"".join(encode(value) for value in values)
+        key = (kind, tuple(indices), count, data)
+        base = self.blocks.get(key)
+
+        if base is None:
+            base = len(table)
+            table.extend(values)
+            self.blocks[key] = base
+        else:
+            self.reused_keys += len(values)
+
+        return base
+
+def quantize_rotation(rotation):
+    # The way quaternions are stored in the file
+    return (round(rotation.x * 32767), round(rotation.y * 32767),
+            round(rotation.z * 32767), round(rotation.w * -32767))
+
+def encode_rotation(rotation):
+    return struct.pack("<4h", *quantize_rotation(rotation))
+
+def encode_vector(vector):
+    return struct.pack("<3f", *vector)
+
+def encode_float(value):
+    return struct.pack("<f", value)
+
+def encode_objectstate(state):
+    return struct.pack("<fii", state.vis, state.frame, state.matFrame)
+
+def write_sequence_keys(seq, keys,
+                        rotations, translations,
+                        uniform_scales, aligned_scales,
+                        objectstates=None,
+                        block_cache=None):
+    # A sequence has one block of each kind, so on its own cache every
+    # block is simply appended
+    if block_cache is None:
+        block_cache = KeyBlockCache()
+
+    add = block_cache.add
+
+    count = len(keys.frames)
+    seq.numKeyframes = count
+
+    # Keys are stored grouped by node, in node index order
+    indices = sorted(keys.translations)
+    values = [value for index in indices for value in keys.translations[index]]
+    seq.baseTranslation = add("translation", translations, indices, count, values, encode_vector)
+
+    indices = sorted(keys.rotations)
+    values = [value for index in indices for value in keys.rotations[index]]
+    seq.baseRotation = add("rotation", rotations, indices, count, values, encode_rotation)
+
+    indices = sorted(keys.scales)
+
+    if seq.flags & Sequence.UniformScale:
+        values = [scale.x for index in indices for scale in keys.scales[index]]
+        seq.baseScale = add("uniform scale", uniform_scales, indices, count, values, encode_float)
+    else:
+        values = [scale for index in indices for scale in keys.scales[index]]
+        seq.baseScale = add("aligned scale", aligned_scales, indices, count, values, encode_vector)
+
+    if objectstates is not None:
+        indices = sorted(keys.vis)
+        values = [ObjectState(vis, int(round(frame)), 0)
+                  for index in indices for vis, frame in zip(keys.vis[index], keys.frames)]
+        seq.baseObjectState = add("vis", objectstates, indices, count, values, encode_objectstate)
+
+def lerp_key(a, b, t):
+    if isinstance(a, Quaternion):
+        # Keep the interpolation on the short arc
+        if a.dot(b) < 0:
+            b = -b
+        return a.slerp(b, t)
+    elif isinstance(a, Vector):
+        return a.lerp(b, t)
+    else:
+        return a + (b - a) * t
+
+def sample_keys(values, position, cyclic):
+    # Evaluate a key list at a fractional key position like the engine does,
+    # cyclic sequences interpolate from the last key back to the first one
+    count = len(values)
+    index = int(position)
+    t = position - index
+
+    if cyclic:
+        index %= count
+        return lerp_key(values[index], values[(index + 1) % count], t)
+
+    if index >= count - 1:
+        return values[-1]
+
+    return lerp_key(values[index], values[index + 1], t)
+
+def key_positions(old_count, new_count, cyclic):
+    # Where each of new_count keys falls on a list of old_count keys
+    if cyclic:
+        return [i * old_count / new_count for i in range(new_count)]
+    elif new_count == 1:
+        return [0.0]
+    else:
+        return [i * (old_count - 1) / (new_count - 1) for i in range(new_count)]
+
+def rotation_error(a, b):
+    # acos of the dot product is too imprecise for tiny angles
+    difference = a.conjugated() @ b
+    return 2 * atan2(Vector(difference[1:]).length, abs(difference.w))
+
+def resample_fits(channels, new_count, cyclic):
+    old_count = len(channels[0][0])
+
+    for values, error, tolerance in channels:
+        resampled = [sample_keys(values, position, cyclic)
+                     for position in key_positions(old_count, new_count, cyclic)]
+
+        # Check the error at every original key
+        for position, value in zip(key_positions(new_count, old_count, cyclic), values):
+            if error(sample_keys(resampled, position, cyclic), value) > tolerance:
+                return False
+
+    return True
+
+def decimate_sequence_keys(seq, keys, rotation_tolerance, translation_tolerance, scale_tolerance):
+    # Scale is a ratio, so its error is relative to the original scale.
+    # Visibility goes from 0 to 1, the same tolerance is a fraction of that.
+    cyclic = bool(seq.flags & Sequence.Cyclic)
+    old_count = len(keys.frames)
+
+    distance = lambda a, b: (a - b).length
+    relative_distance = lambda a, b: (a - b).length / max(b.length, 1e-6)
+    difference = lambda a, b: abs(a - b)
+
+    channels = []
+    channels.extend((values, rotation_error, rotation_tolerance)
+                    for values in keys.rotations.values())
+    channels.extend((values, distance, translation_tolerance)
+                    for values in keys.translations.values())
+    channels.extend((values, relative_distance, scale_tolerance)
+                    for values in keys.scales.values())
+    channels.extend((values, difference, scale_tolerance)
+                    for values in keys.vis.values())
+
+    if old_count <= 2:
+        return old_count
+
+    if channels:
+        # Binary search for the smallest key count that stays within the
+        # tolerances. The full key count always fits.
+        low, high = 2, old_count
+
+        while low < high:
+            middle = (low + high) // 2
+
+            if resample_fits(channels, middle, cyclic):
+                high = middle
+            else:
+                low = middle + 1
+
+        new_count = low
+    else:
+        new_count = 2
+
+    if new_count == old_count:
+        return new_count
+
+    positions = key_positions(old_count, new_count, cyclic)
+
+    for table in (keys.rotations, keys.translations, keys.scales, keys.vis):
+        for index, values in table.items():
+            table[index] = [sample_keys(values, position, cyclic) for position in positions]
+
+    first_frame = keys.frames[0]
+    keys.frames = [first_frame + position for position in positions]
+
+    return new_count
+
+def animated_nodes(matters, mapping):
+    return [index for index, matter in enumerate(matters[:len(mapping)]) if matter]
+
+def remap_matters(matters, mapping, count):
+    # mapping gives the target node index of each source node. Returns the
+    # matters over the target's count nodes and the order in which the
+    # source's keyframe blocks have to be copied. Blocks are stored in node
+    # order, which the mapping may have changed.
+    animated = animated_nodes(matters, mapping)
+    result = [False] * count
+
+    for index in animated:
+        result[mapping[index]] = True
+
+    order = sorted(range(len(animated)), key=lambda block: mapping[animated[block]])
+    return result, order
+
+def copy_blocks(source, base, order, count):
+    # Block k holds the count keyframes of the k-th animated node
+    blocks = [source[base + block * count:base + (block + 1) * count] for block in order]
+
+    if not blocks:
+        return source[:0]
+
+    return np.concatenate(blocks)
@@ -0,0 +1,154 @@
+import sys
+import argparse
+
+from .DtsShape import DtsShape
+from .DsqFile import DsqFile, decode_quats
+from .DtsTypes import Sequence, Trigger, Vector, Quaternion
+from .sequence_util import animated_nodes, remap_matters, copy_blocks
+
+# Adds the sequences of DSQ files to a DTS shape without going through
+# Blender. Only the animation data is touched, everything else in the shape
+# is written back as it was read.
+
+class SpliceError(Exception):
+    pass
+
+def node_map(shape, dsq):
+    # Shape node index for each DSQ node, None if the shape doesn't have it.
+    # Node names are case-insensitive, as in import_dsq.
+    by_name = {}
+
+    for index, node in enumerate(shape.nodes):
+        by_name.setdefault(shape.names[node.name].lower(), index)
+
+    return [by_name.get(name.lower()) for name in dsq.nodes]
+
+def check_dsq(shape, dsq, mapping):
+    missing = set()
+
+    for seq in dsq.sequences:
+        for matters in (seq.rotationMatters, seq.translationMatters, seq.scaleMatters):
+            missing.update(dsq.nodes[index] for index in animated_nodes(matters, mapping)
+                           if mapping[index] is None)
+
+    if missing:
+        raise SpliceError("The following animated nodes could not be found in the shape:\n"
+                          + ", ".join(sorted(missing)))
+
+    existing = set(shape.names[seq.nameIndex].lower() for seq in shape.sequences)
+
+    for seq in dsq.sequences:
+        if seq.name.lower() in existing:
+            raise SpliceError("The shape already has a sequence named '{}'".format(seq.name))
+
+        existing.add(seq.name.lower())
+
+def splice_sequence(shape, dsq, dseq, mapping):
+    seq = Sequence()
+    seq.name = dseq.name
+    seq.nameIndex = shape.name(dseq.name)
+    seq.flags = dseq.flags
+    seq.numKeyframes = dseq.numKeyframes
+    seq.duration = dseq.duration
+    seq.priority = dseq.priority
+    seq.toolBegin = dseq.toolBegin
+
+    count = dseq.numKeyframes
+    num_nodes = len(shape.nodes)
+
+    seq.rotationMatters, order = remap_matters(dseq.rotationMatters, mapping, num_nodes)
+    seq.baseRotation = len(shape.node_rotations)
+    rotations = copy_blocks(dsq.rotations, dseq.baseRotation, order, count)
+    shape.node_rotations.extend(Quaternion(rot) for rot in decode_quats(rotations))
+
+    seq.translationMatters, order = remap_matters(dseq.translationMatters, mapping, num_nodes)
+    seq.baseTranslation = len(shape.node_translations)
+    translations = copy_blocks(dsq.translations, dseq.baseTranslation, order, count)
+    shape.node_translations.extend(Vector(vec) for vec in translations)
+
+    seq.scaleMatters, order = remap_matters(dseq.scaleMatters, mapping, num_nodes)
+
+    if seq.flags & Sequence.UniformScale:
+        seq.baseScale = len(shape.node_uniform_scales)
+        scales = copy_blocks(dsq.uniform_scales, dseq.baseScale, order, count)
+        shape.node_uniform_scales.extend(float(scale) for scale in scales)
+    elif seq.flags & Sequence.AlignedScale:
+        seq.baseScale = len(shape.node_aligned_scales)
+        scales = copy_blocks(dsq.aligned_scales, dseq.baseScale, order, count)
+        shape.node_aligned_scales.extend(Vector(vec) for vec in scales)
+    elif seq.flags & Sequence.ArbitraryScale:
+        seq.baseScale = len(shape.node_arbitrary_scale_factors)
+        factors = copy_blocks(dsq.arbitrary_scale_factors, dseq.baseScale, order, count)
+        rotations = copy_blocks(dsq.arbitrary_scale_rots, dseq.baseScale, order, count)
+        shape.node_arbitrary_scale_factors.extend(Vector(vec) for vec in factors)
+        shape.node_arbitrary_scale_rots.extend(Quaternion(rot) for rot in decode_quats(rotations))
+
+    first, num = dseq.firstGroundFrame, dseq.numGroundFrames
+    seq.firstGroundFrame = len(shape.ground_translations)
+    seq.numGroundFrames = num
+    shape.ground_translations.extend(Vector(vec) for vec in dsq.ground_translations[first:first + num])
+    shape.ground_rotations.extend(Quaternion(rot) for rot in decode_quats(dsq.ground_rotations[first:first + num]))
+
+    first, num = dseq.firstTrigger, dseq.numTriggers
+    seq.firstTrigger = len(shape.triggers)
+    seq.numTriggers = num
+    shape.triggers.extend(Trigger(trigger.state, trigger.pos) for trigger in dsq.triggers[first:first + num])
+
+    # DSQ files carry no object, decal or IFL animation
+    seq.baseObjectState = 0
+    seq.baseDecalState = 0
+    seq.visMatters = [False] * len(shape.objects)
+    seq.frameMatters = [False] * len(shape.objects)
+    seq.matFrameMatters = [False] * len(shape.objects)
+    seq.decalMatters = [False] * len(shape.decals)
+    seq.iflMatters = [False] * len(shape.iflmaterials)
+
+    return seq
+
+def splice(shape, dsq):
+    # Appends all sequences of dsq to shape. Raises SpliceError before
+    # changing anything if the DSQ doesn't fit the shape.
+    mapping = node_map(shape, dsq)
+    check_dsq(shape, dsq, mapping)
+
+    for dseq in dsq.sequences:
+        shape.sequences.append(splice_sequence(shape, dsq, dseq, mapping))
+
+    return len(dsq.sequences)
+
+def splice_files(shape_path, dsq_paths, output_path):
+    shape = DtsShape()
+
+    with open(shape_path, "rb") as fd:
+        shape.load(fd)
+
+    for path in dsq_paths:
+        dsq = DsqFile()
+
+        with open(path, "rb") as fd:
+            dsq.read(fd)
+
+        print("Added {} sequences from {}".format(splice(shape, dsq), path), file=sys.stderr)
+
+    with open(output_path, "wb") as fd:
+        shape.save(fd)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Add the sequences of DSQ files to a DTS shape without re-exporting it")
+    parser.add_argument("shape", help="DTS file to add the sequences to")
+    parser.add_argument("dsq", nargs="+", help="DSQ files with the sequences")
+    parser.add_argument("-o", "--output", required=True,
+                        help="Where to write the resulting DTS (may be the input shape)")
+    args = parser.parse_args(argv)
+
+    try:
+        splice_files(args.shape, args.dsq, args.output)
+    except SpliceError as e:
+        print("Error:", e, file=sys.stderr)
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
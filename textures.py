@@ -0,0 +1,90 @@
+import os
+
+texture_extensions = ("png", "jpg")
+
+class TextureIndex:
+    # Remembers the files in every directory textures were looked up in,
+    # by lowercase name. A directory is checked for changes through its
+    # mtime only once per generation, every import starts a new one, so
+    # repeated lookups during an import cost no system calls at all.
+
+    def __init__(self):
+        self.generation = 0
+        self.directories = {}
+        self.mounts = {}
+
+    def new_generation(self):
+        self.generation += 1
+
+    def listing(self, dirname):
+        cached = self.directories.get(dirname)
+
+        if cached is not None and cached[0] == self.generation:
+            return cached[2]
+
+        try:
+            mtime = os.stat(dirname).st_mtime_ns
+        except OSError:
+            self.directories[dirname] = (self.generation, None, {})
+            return {}
+
+        if cached is not None and cached[1] == mtime:
+            self.directories[dirname] = (self.generation, mtime, cached[2])
+            return cached[2]
+
+        files = {}
+
+        try:
+            with os.scandir(dirname) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        files[entry.name.lower()] = entry.path
+        except OSError:
+            pass
+
+        self.directories[dirname] = (self.generation, mtime, files)
+        return files
+
+    def is_mount(self, dirname):
+        mount = self.mounts.get(dirname)
+
+        if mount is None:
+            mount = self.mounts[dirname] = os.path.ismount(dirname)
+
+        return mount
+
+    def find(self, dirname, name):
+        # name may contain directories of its own
+        texdir, texbase = os.path.split(os.path.join(dirname, name))
+        files = self.listing(texdir)
+
+        for extension in texture_extensions:
+            path = files.get((texbase + "." + extension).lower())
+
+            if path is not None:
+                return path
+
+    def resolve(self, filepath, name):
+        # Look next to the file first, then in every directory above it
+        dirname = os.path.dirname(filepath)
+
+        while True:
+            path = self.find(dirname, name)
+
+            if path is not None:
+                return path
+
+            if self.is_mount(dirname):
+                break
+
+            prevdir, dirname = dirname, os.path.dirname(dirname)
+
+            if prevdir == dirname:
+                break
+
+    def clear(self):
+        self.directories.clear()
+        self.mounts.clear()
+
+# Shared by everything in this session
+texture_index = TextureIndex()
@@ -4,7 +4,7 @@ from colorsys import hsv_to_rgb
 from itertools import count
 from fractions import Fraction
 
-texture_extensions = ("png", "jpg")
+from .textures import texture_extensions, texture_index
 
 default_materials = {
     "black": (0, 0, 0, 255),
@@ -33,24 +33,7 @@ for key, value in tuple(default_materials.items()):
     default_materials[key.lower()] = value
 
 def resolve_texture(filepath, name):
-    dirname = os.path.dirname(filepath)
-
-    while True:
-        texbase = os.path.join(dirname, name)
-
-        for extension in texture_extensions:
-            texname = texbase + "." + extension
-
-            if os.path.isfile(texname):
-                return texname
-
-        if os.path.ismount(dirname):
-            break
-
-        prevdir, dirname = dirname, os.path.dirname(dirname)
-
-        if prevdir == dirname:
-            break
+    return texture_index.resolve(filepath, name)
 
 def fractions():
     yield 0
@@ -128,6 +111,50 @@ def ob_rotation_curves(ob):
 def ob_vis_curves(ob): 
     return ob_curves_array(ob, 'torque_vis_props.vis_value', 1)
 
+# Value of the LINEAR item in the keyframe interpolation enum
+interpolation_linear = 1
+
+class KeyframeBuffer:
+    # Collects keyframes per F-curve and inserts all of them with a single
+    # keyframe_points.add() per curve, since adding them one at a time
+    # reallocates the keyframe array every time
+
+    def __init__(self):
+        self.keys = {}
+
+    def add(self, curve, frames, values):
+        co = self.keys.setdefault(curve, [])
+
+        for frame, value in zip(frames, values):
+            co.append(frame)
+            co.append(value)
+
+    def add_array(self, curves, frames, values):
+        # values holds one vector per frame, indexed by each curve's array_index
+        for curve in curves:
+            index = curve.array_index
+            self.add(curve, frames, [value[index] for value in values])
+
+    def flush(self):
+        for curve, co in self.keys.items():
+            points = curve.keyframe_points
+            existing = len(points)
+
+            old_co = [0.0] * (existing * 2)
+            old_interpolation = [0] * existing
+            points.foreach_get("co", old_co)
+            points.foreach_get("interpolation", old_interpolation)
+
+            added = len(co) // 2
+            points.add(added)
+            points.foreach_set("co", old_co + co)
+            points.foreach_set("interpolation", old_interpolation + [interpolation_linear] * added)
+
+            # Sorts the keyframes and recalculates the handles
+            curve.update()
+
+        self.keys.clear()
+
 def evaluate_all(curves, frame):
     return tuple(map(lambda c: c.evaluate(frame), curves))
 
@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import time
+import queue
+import importlib
+import threading
+import traceback
+import subprocess
+
+# Prefix for the lines a worker writes back to the pool. Anything else on
+# stdout is ordinary Blender/exporter output.
+reply_marker = "@@io_scene_dts@@ "
+
+package_dir = os.path.dirname(os.path.abspath(__file__))
+package_name = os.path.basename(package_dir)
+
+class WorkerError(Exception):
+    pass
+
+class BlenderWorker:
+    # A background Blender process that runs jobs until its stdin is closed
+
+    def __init__(self, blender):
+        expr = (
+            "import sys, importlib; "
+            "sys.path.insert(0, {!r}); "
+            "importlib.import_module({!r}).worker_main()"
+        ).format(os.path.dirname(package_dir), package_name + ".worker_pool")
+
+        self.process = subprocess.Popen(
+            [blender, "--background", "--factory-startup", "--python-expr", expr],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            bufsize=1)
+
+        # Output is read on its own thread so waiting for a reply can time
+        # out. None marks the end of the output.
+        self.lines = queue.Queue()
+        self.reader = threading.Thread(target=self.read_output, daemon=True)
+        self.reader.start()
+
+    def read_output(self):
+        try:
+            for line in self.process.stdout:
+                self.lines.put(line)
+        finally:
+            self.lines.put(None)
+
+    def run(self, job, timeout=None):
+        # Raises WorkerError if the worker dies or takes longer than timeout
+        # seconds, it is killed then and can't be used again
+        log = []
+        deadline = None if timeout is None else time.perf_counter() + timeout
+
+        try:
+            self.process.stdin.write(json.dumps(job) + "\n")
+            self.process.stdin.flush()
+        except OSError as e:
+            raise WorkerError("Worker is gone ({})".format(e))
+
+        while True:
+            try:
+                if deadline is None:
+                    line = self.lines.get()
+                else:
+                    line = self.lines.get(timeout=max(0, deadline - time.perf_counter()))
+            except queue.Empty:
+                self.process.kill()
+                raise WorkerError("Job took longer than {} seconds:\n{}".format(
+                    timeout, "\n".join(log[-20:])))
+
+            if line is None:
+                break
+
+            if line.startswith(reply_marker):
+                reply = json.loads(line[len(reply_marker):])
+                reply["log"] = log
+                return reply
+
+            log.append(line.rstrip("\n"))
+
+        raise WorkerError("Worker exited with code {}:\n{}".format(
+            self.process.wait(), "\n".join(log[-20:])))
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+
+        self.process.wait()
+
+class WorkerPool:
+    # Hands out jobs to a fixed number of reused Blender workers.
+    # A worker that crashes or runs out of time fails its job and is
+    # replaced for the next one.
+
+    def __init__(self, blender, size, timeout=None):
+        self.blender = blender
+        self.size = max(1, size)
+        self.timeout = timeout
+
+    def run(self, jobs):
+        # Yields (job, reply) pairs as jobs finish, in no particular order
+        pending = queue.Queue()
+        done = queue.Queue()
+
+        for job in jobs:
+            pending.put(job)
+
+        def serve():
+            worker = None
+
+            try:
+                while True:
+                    try:
+                        job = pending.get_nowait()
+                    except queue.Empty:
+                        break
+
+                    start = time.perf_counter()
+
+                    try:
+                        if worker is None:
+                            worker = BlenderWorker(self.blender)
+
+                        reply = worker.run(job, self.timeout)
+                    except (WorkerError, OSError) as e:
+                        if worker is not None:
+                            worker.close()
+                        worker = None
+                        reply = {"ok": False, "error": str(e), "log": []}
+
+                    reply["seconds"] = time.perf_counter() - start
+                    done.put((job, reply))
+            finally:
+                if worker is not None:
+                    worker.close()
+
+        threads = [threading.Thread(target=serve, daemon=True)
+                   for i in range(min(self.size, pending.qsize()))]
+
+        for thread in threads:
+            thread.start()
+
+        for i in range(len(jobs)):
+            yield done.get()
+
+        for thread in threads:
+            thread.join()
+
+def send_reply(data):
+    sys.stdout.write(reply_marker + json.dumps(data) + "\n")
+    sys.stdout.flush()
+
+def worker_main():
+    # Runs inside Blender. Jobs name the function that handles them as
+    # "module:function", relative to this package.
+    package = importlib.import_module(package_name)
+    package.register()
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+
+        job = json.loads(line)
+
+        try:
+            module_name, function_name = job["handler"].split(":")
+            module = importlib.import_module("." + module_name, package_name)
+            result = getattr(module, function_name)(job)
+            result.setdefault("ok", True)
+        except Exception as e:
+            traceback.print_exc(file=sys.stdout)
+            result = {"ok": False, "error": "{}: {}".format(type(e).__name__, e)}
+
+        send_reply(result)
@@ -1,4 +1,5 @@
 from .DtsTypes import *
+from .primitives import decode_primitives
 
 def write_debug_report(filepath, shape):
     with open(filepath, "w") as fd:
@@ -40,8 +41,8 @@ def write_debug_report(filepath, shape):
             p("    subshape = " + str(lod.subshape))
             p("    objectDetail = " + str(lod.objectDetail))
             p("    polyCount = " + str(lod.polyCount))
-            # p("    avgError (unused) = " + str(lod.avgError))
-            # p("    maxError (unused) = " + str(lod.maxError))
+            p("    avgError = " + str(lod.avgError))
+            p("    maxError = " + str(lod.maxError))
 
         p("Subshapes (" + str(len(shape.subshapes)) + "):")
         for i, sub in enumerate(shape.subshapes):
@@ -122,7 +123,7 @@ def write_debug_report(filepath, shape):
             # p("    numFrames = " + str(mesh.numFrames))
             # p("    numMatFrames = " + str(mesh.numMatFrames))
             # p("    vertsPerFrame = " + str(mesh.vertsPerFrame))
-            # p("    parent (unused?) = " + str(mesh.parent))
+            p("    parent = " + str(mesh.parent))
             # p("    indices = " + ",".join(map(str, mesh.indices)))
             # p("    mindices = " + ",".join(map(str, mesh.mindices)))
             p("    + Primitives (" + str(len(mesh.primitives)) + "):")
@@ -143,6 +144,8 @@ def write_debug_report(filepath, shape):
                 mat = prim.type & Primitive.MaterialMask
                 flags += " MaterialMask:" + str(mat)
                 p("      " + str(prim.firstElement) + "->" + str(prim.firstElement + prim.numElements - 1) + " " + str(prim.type) + flags)
+            faces, _ = decode_primitives(mesh.primitives, mesh.indices)
+            p("    triangles = " + str(len(faces)))
             p("    + Vertices (" + str(len(mesh.verts)) + "): <omitted>")
             # for i in range(len(mesh.verts)):
             #     p("      vert" + str(i) + " " + str(mesh.verts[i]) + " normal " + str(mesh.normals[i]) + " encoded " + str(mesh.enormals[i]))